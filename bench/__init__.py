@@ -0,0 +1,88 @@
+# Benchmarks
+#
+# Helpers shared by the benchmark scripts in this package. Every script
+# builds its own synthetic database through `mlog` itself, so the data
+# layout always matches what the collector writes.
+#
+
+import os
+import time
+import random
+import tempfile
+
+from collections import namedtuple
+
+# Minimal stand-in for `mlog.Log`, `Container.add` only reads these two fields
+Sample = namedtuple('Sample', 'name window')
+
+
+def synthesize(path, days=60, interval=5, apps=12, windows=40, hours=9,
+               skew=1.0, seed=0):
+    '''Write a synthetic history into a database at path.
+
+    Each simulated day has `hours` of activity which are sampled every
+    `interval` seconds and dumped once a minute, exactly as `mlog.Runner`
+    does. Applications and their windows are picked with a Zipf-like
+    distribution, so few of them dominate and there is a long tail.
+
+    Returns:
+        number of containers written
+    '''
+    from mlog import Container
+
+    rnd = random.Random(seed)
+    app_names = [f'app-{i}' for i in range(apps)]
+    app_weights = [1 / (i + 1) ** skew for i in range(apps)]
+    window_names = [f'window-{i}.example.com' for i in range(windows)]
+    window_weights = [1 / (i + 1) ** skew for i in range(windows)]
+
+    container = Container(interval, path)
+    # Generated data is disposable, durability only slows generation down
+    container.cur.execute('pragma synchronous = off')
+
+    ticks = int(60 / interval)
+    now = int(time.time())
+    start = now - days * 24 * 60 * 60
+    count = 0
+
+    for day in range(days):
+        epoch = start + day * 24 * 60 * 60
+        for minute in range(hours * 60):
+            container.name = epoch + minute * 60
+            app = rnd.choices(app_names, app_weights)[0]
+            for _ in range(ticks):
+                # Users mostly stay in one app for a minute
+                if rnd.random() < 0.1:
+                    app = rnd.choices(app_names, app_weights)[0]
+                window = rnd.choices(window_names, window_weights)[0]
+                container.add(Sample(app, window))
+            container.add_container()
+            container.blocks.clear()
+            count += 1
+
+    container.con.commit()
+    return count
+
+
+def temp_db(prefix='mlog-bench-'):
+    '''Path to a fresh database file in a temporary directory'''
+    return os.path.join(tempfile.mkdtemp(prefix=prefix), 'mlog.db')
+
+
+def timeit(fn, repeat=3):
+    '''Best wall time of fn in seconds and its last result'''
+    best = None
+    res = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = fn()
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+
+    return best, res
+
+
+def percentiles(samples, ps=(50, 95, 99)):
+    '''Nearest rank percentiles of samples by percent'''
+    s = sorted(samples)
+    return {p: s[min(len(s) - 1, int(len(s) * p / 100))] for p in ps}
@@ -0,0 +1,221 @@
+# Storage and reporting benchmark suite
+#
+# Generates a synthetic history through `mlog.Model`, then times the
+# reporting paths on it: `Reader` ranges in every mode, warm and cold on
+# a new reader, `Timeframe` sum and print, the Flask client's bar records,
+# and finally `Container.dump` into the generated database. Results are written as JSON with
+# percentiles, so runs on different commits can be compared.
+#
+#   python3 -m bench --months 3 --output before.json
+#   python3 -m bench --months 3 --compare before.json
+#
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import contextlib
+import subprocess
+
+from bench import Sample, percentiles, synthesize, temp_db
+from utils import REPORT_MODE, Reader, Timeframe, np
+
+
+def measure(fn, repeat, warm=True):
+    '''Wall times of repeat calls of fn in seconds, after a warm up call
+    unless warm is False'''
+    if warm:
+        fn()
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+
+    return samples
+
+
+def summary(samples):
+    '''Percentiles and extremes of samples in milliseconds'''
+    p = percentiles(samples, (50, 90, 95, 99))
+    res = {f'p{k}': round(v * 1000, 3) for k, v in p.items()}
+    res['min'] = round(min(samples) * 1000, 3)
+    res['max'] = round(max(samples) * 1000, 3)
+    res['mean'] = round(sum(samples) / len(samples) * 1000, 3)
+    res['n'] = len(samples)
+    return res
+
+
+def commit():
+    '''Current git commit, or None outside of a checkout'''
+    try:
+        res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return res.stdout.strip()
+
+
+def readers(path, repeat, cold_repeat):
+    modes = ('raw', 'aggregate') + (() if np is None else ('columnar', ))
+    ranges = {
+        'today': lambda r: r.today(),
+        'last_days(7)': lambda r: r.last_days(7),
+        'last_weeks(4)': lambda r: r.last_weeks(4),
+    }
+    res = {}
+    for mode in modes:
+        r = Reader(path, mode=mode)
+        for name, fn in ranges.items():
+            res[f'reader.{mode}.{name}'] = measure(lambda: fn(r), repeat)
+            # First call of a new reader, as every run of cli.py is
+            res[f'reader.{mode}.{name}.cold'] = measure(
+                lambda: fn(Reader(path, mode=mode)), cold_repeat, warm=False)
+
+    return res
+
+
+def timeframes(path, repeat):
+    # Raw records make Timeframe do all the summing
+    records = Reader(path).last_weeks(4)
+    out = io.StringIO()
+
+    def show():
+        with contextlib.redirect_stdout(out):
+            Timeframe(records).print()
+        out.seek(0)
+        out.truncate()
+
+    return {
+        'timeframe.sum': measure(lambda: Timeframe(records).sum(), repeat),
+        'timeframe.print': measure(show, repeat),
+    }
+
+
+def client(path, repeat):
+    # The client opens its reader on import, keep it off the real database
+    os.environ['HOME'] = os.path.dirname(path)
+    from client.main import get_bar_records, get_detailed_bar_records
+
+    records = Reader(path, mode=REPORT_MODE).last_weeks(4)
+    top = get_bar_records(records, 'month')['frames'][0]['name']
+
+    return {
+        'client.get_bar_records': measure(
+            lambda: get_bar_records(records, 'month'), repeat),
+        'client.get_detailed_bar_records': measure(
+            lambda: get_detailed_bar_records(records, 'month', top), repeat),
+    }
+
+
+def dumps(path, repeat, args):
+    from mlog import Container
+
+    rnd = random.Random(args.seed)
+    c = Container(args.interval, path)
+    ticks = int(60 / args.interval)
+    samples = []
+    for _ in range(repeat):
+        for _ in range(ticks):
+            c.add(Sample(f'app-{rnd.randrange(args.apps)}',
+                         f'window-{rnd.randrange(args.windows)}.example.com'))
+        t = time.perf_counter()
+        c.dump()
+        samples.append(time.perf_counter() - t)
+
+    return {'container.dump': samples}
+
+
+def compare(results, path):
+    '''Print p50 of results against a baseline run at path'''
+    with open(path) as f:
+        base = json.load(f)['results']
+
+    for name, res in results.items():
+        old = base.get(name)
+        if old is None:
+            print(f'{name:40} {res["p50"]:10.3f} ms', file=sys.stderr)
+            continue
+        change = (res['p50'] / old['p50'] - 1) * 100 if old['p50'] else 0
+        print(f'{name:40} {old["p50"]:10.3f} -> {res["p50"]:10.3f} ms '
+              f'{change:+7.1f}%', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Storage and reporting benchmark suite')
+    parser.add_argument('--months', type=int, default=3,
+                        help='months of generated history')
+    parser.add_argument('--interval', type=int, default=5,
+                        help='sampling interval in seconds')
+    parser.add_argument('--hours', type=int, default=9,
+                        help='active hours a day')
+    parser.add_argument('--apps', type=int, default=12,
+                        help='number of distinct applications')
+    parser.add_argument('--windows', type=int, default=40,
+                        help='number of distinct windows')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent of app and window popularity')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='timed calls per benchmark')
+    parser.add_argument('--cold', type=int, default=5,
+                        help='timed first calls of a new reader per range')
+    parser.add_argument('--db', help='reuse a generated database at path')
+    parser.add_argument('-o', '--output', help='write JSON to a file')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='print p50 changes against a previous run')
+    args = parser.parse_args()
+
+    path = args.db or temp_db()
+    t = time.perf_counter()
+    count = None
+    if not (args.db and os.path.exists(path)):
+        count = synthesize(path, days=args.months * 30,
+                           interval=args.interval, apps=args.apps,
+                           windows=args.windows, hours=args.hours,
+                           skew=args.skew, seed=args.seed)
+    generated = time.perf_counter() - t
+
+    samples = {}
+    samples.update(readers(path, args.repeat, args.cold))
+    samples.update(timeframes(path, args.repeat))
+    samples.update(client(path, args.repeat))
+    # Dumps grow the database, so they go last
+    samples.update(dumps(path, args.repeat, args))
+
+    results = {name: summary(s) for name, s in samples.items()}
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': None if np is None else np.__version__,
+        'params': vars(args),
+        'database': {
+            'path': path,
+            'bytes': os.path.getsize(path),
+            'containers': count,
+            'generated_s': round(generated, 3),
+        },
+        'results': results,
+    }
+
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(body + '\n')
+    else:
+        print(body)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
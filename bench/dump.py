@@ -0,0 +1,86 @@
+# Benchmark of `Container.dump` latency
+#
+# Dumps containers of a given size and compares the batched single
+# transaction write with the previous row by row write, which committed
+# after every window with SQLite's default journal and sync settings.
+#
+#   python3 -m bench.dump --apps 20 --windows 50
+#
+
+import time
+import sqlite3
+import argparse
+
+from bench import Sample, percentiles, temp_db
+
+
+LEGACY_SCHEMA = '''
+create table containers (
+    container_id integer primary key autoincrement, name integer);
+create table blocks (
+    block_id integer primary key autoincrement, container_id integer,
+    name text);
+create table windows (
+    window_id integer primary key autoincrement, block_id integer,
+    name text, time integer);
+'''
+
+
+def row_dump(con, container):
+    '''Previous `Model.add_container`, for reference'''
+    cur = con.cursor()
+    cur.execute('insert into containers (name) values (?)', (container.name, ))
+    fk = cur.lastrowid
+    for block in container.blocks.values():
+        cur.execute('insert into blocks (container_id, name) values (?, ?)',
+                    (fk, block.name))
+        bk = cur.lastrowid
+        for window in block.windows.values():
+            cur.execute(
+                'insert into windows (block_id, name, time) values (?, ?, ?)',
+                (bk, window.name, window.time))
+            con.commit()
+
+
+def report(name, samples):
+    p = percentiles(samples)
+    print(f'{name}:\tp50 {p[50] * 1000:.2f} ms\tp95 {p[95] * 1000:.2f} ms\t'
+          f'p99 {p[99] * 1000:.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dump latency benchmark')
+    parser.add_argument('--apps', type=int, default=20)
+    parser.add_argument('--windows', type=int, default=50)
+    parser.add_argument('--dumps', type=int, default=50)
+    args = parser.parse_args()
+
+    from mlog import Container
+
+    c = Container(5, temp_db())
+    legacy = sqlite3.connect(temp_db())
+    legacy.executescript(LEGACY_SCHEMA)
+
+    print(f'{args.apps} apps x {args.windows} windows per container')
+
+    batched = []
+    rows = []
+    for _ in range(args.dumps):
+        for a in range(args.apps):
+            for w in range(args.windows):
+                c.add(Sample(f'app-{a}', f'window-{w}'))
+
+        t = time.perf_counter()
+        row_dump(legacy, c)
+        rows.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        c.dump()
+        batched.append(time.perf_counter() - t)
+
+    report('row by row', rows)
+    report('batched', batched)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Benchmark of grouping by application and window name
+#
+# Feeds synthetic logs with many distinct windows through the collector's
+# `Container.add` and the reader's `Timeframe.sum`, and compares both with
+# the previous list scanning implementations.
+#
+#   python3 -m bench.grouping --logs 100000 --windows 5000
+#
+
+import random
+import argparse
+
+from bench import Sample, temp_db, timeit
+from utils import Timeframe, Container, Block, Window
+
+
+class ListContainer:
+    '''Previous list based `mlog.Container.add`, for reference'''
+
+    def __init__(self, interval=5):
+        self.interval = interval
+        self.blocks = []
+
+    def add(self, log):
+        for block in self.blocks:
+            if block[0] == log.name:
+                for window in block[1]:
+                    if window[0] == log.window:
+                        window[1] += self.interval
+                        break
+                else:
+                    block[1].append([log.window, self.interval])
+                return
+
+        self.blocks.append([log.name, [[log.window, self.interval]]])
+
+
+def list_sum(containers):
+    '''Previous list based `Timeframe.sum`, for reference'''
+    blocks = []
+    for container in containers:
+        blocks += container.blocks
+
+    names = []
+    for block in blocks:
+        if block.name not in names:
+            names.append(block.name)
+
+    groups = [Block(None, None, name) for name in names]
+    for block in blocks:
+        for group in groups:
+            if block.name == group.name:
+                group.windows += block.windows
+
+    for group in groups:
+        wnames = []
+        for window in group.windows:
+            if window.name not in wnames:
+                wnames.append(window.name)
+
+        windows = [Window(None, None, name, 0) for name in wnames]
+        for window in group.windows:
+            for item in windows:
+                if window.name == item.name:
+                    item.time += window.time
+        group.windows = windows
+
+    return groups
+
+
+def make_logs(n, apps, windows, seed=0):
+    rnd = random.Random(seed)
+    return [Sample(f'app-{rnd.randrange(apps)}',
+                   f'window-{rnd.randrange(windows)}') for _ in range(n)]
+
+
+def make_containers(logs, per_container=12):
+    '''Reader side containers, one block and window per log'''
+    containers = []
+    for i in range(0, len(logs), per_container):
+        c = Container(i, i)
+        for log in logs[i:i + per_container]:
+            b = Block(i, None, log.name)
+            b.add_window(Window(None, None, log.window, 5))
+            c.add_block(b)
+        containers.append(c)
+
+    return containers
+
+
+def collect(cls, logs):
+    c = cls()
+    for log in logs:
+        c.add(log)
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grouping benchmark')
+    parser.add_argument('--logs', type=int, default=100000)
+    parser.add_argument('--windows', type=int, default=5000)
+    parser.add_argument('--apps', type=int, default=20)
+    args = parser.parse_args()
+
+    from mlog import Container as Collector
+
+    logs = make_logs(args.logs, args.apps, args.windows)
+    path = temp_db()
+
+    old_t, _ = timeit(lambda: collect(ListContainer, logs), repeat=1)
+    new_t, _ = timeit(lambda: collect(lambda: Collector(5, path), logs))
+    print(f'Container.add\tlists: {old_t * 1000:.1f} ms\t'
+          f'dicts: {new_t * 1000:.1f} ms\t{old_t / new_t:.1f}x')
+
+    containers = make_containers(logs)
+    old_t, old = timeit(lambda: list_sum(containers), repeat=1)
+    new_t, new = timeit(lambda: Timeframe(containers).sum())
+    assert [(b.name, [(w.name, w.time) for w in b.windows]) for b in old] == \
+           [(b.name, [(w.name, w.time) for w in b.windows]) for b in new]
+    print(f'Timeframe.sum\tlists: {old_t * 1000:.1f} ms\t'
+          f'dicts: {new_t * 1000:.1f} ms\t{old_t / new_t:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
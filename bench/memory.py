@@ -0,0 +1,78 @@
+# Benchmark of memory used by a month report
+#
+# Reads four weeks of synthetic history with `Reader` and sums them with
+# `Timeframe`, as `cli.py --print_month` does. Every measurement runs in
+# a fresh interpreter, so peak RSS isn't inflated by generating the data.
+#
+#   python3 -m bench.memory --days 28
+#
+
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import tracemalloc
+
+from bench import synthesize, temp_db
+
+
+def measure(path, mode, trace):
+    '''Peak RSS growth of a month report in bytes and its wall time, or
+    peak traced allocation in bytes if trace. Tracing has overhead of its
+    own, so it is measured separately.'''
+    from utils import Reader, Timeframe
+
+    reader = Reader(path, mode=mode)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if trace:
+        tracemalloc.start()
+    t = time.perf_counter()
+
+    Timeframe(reader.last_weeks(4)).sum()
+
+    t = time.perf_counter() - t
+    if trace:
+        return tracemalloc.get_traced_memory()[1]
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) * scale
+
+    return grown, t
+
+
+def run(path, mode, trace=False):
+    args = [sys.executable, '-m', 'bench.memory', '--measure', path, mode]
+    res = subprocess.run(args + (['--trace'] if trace else []),
+                         capture_output=True, text=True, check=True)
+    return res.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Month report memory benchmark')
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--windows', type=int, default=2000)
+    parser.add_argument('--measure', nargs=2, metavar=('PATH', 'MODE'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--trace', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        res = measure(*args.measure, args.trace)
+        print(*(res if isinstance(res, tuple) else (res, )))
+        return
+
+    path = temp_db()
+    # Reports cover the last four weeks, history ends now
+    synthesize(path, days=args.days, windows=args.windows)
+
+    for mode in ('raw', 'aggregate'):
+        grown, t = run(path, mode)
+        peak, = run(path, mode, trace=True)
+        print(f'{mode:10} peak rss +{int(grown) / 2**20:8.1f} MB  '
+              f'traced peak {int(peak) / 2**20:8.1f} MB  {float(t):.2f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+# Benchmark of the whole collector pipeline
+#
+# Drives `Runner` with a scripted probe: every tick samples, aggregates
+# into the container and, once a minute of virtual time, dumps it through
+# the writer thread. Reports ticks per second and checks that everything
+# sampled ends up in the database.
+#
+#   python3 -m bench.pipeline --ticks 100000
+#
+
+import time
+import argparse
+
+from bench import temp_db
+from probes import FakeProbe
+from utils import Reader, Timeframe
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Collector pipeline benchmark')
+    parser.add_argument('--ticks', type=int, default=100000)
+    parser.add_argument('--windows', type=int, default=50)
+    parser.add_argument('--storage', default='containers',
+                        choices=('containers', 'spans'))
+    args = parser.parse_args()
+
+    from mlog import Runner
+
+    script = [(f'app-{i % 7}', f'window-{i}') for i in range(args.windows)]
+    path = temp_db()
+    start = int(time.time()) - (args.ticks + 60) * 5
+    runner = Runner(storage=args.storage, dbname=path,
+                    probe=FakeProbe(script, start=start))
+
+    t = time.perf_counter()
+    for _ in range(args.ticks):
+        runner.tick()
+    runner.stop()
+    t = time.perf_counter() - t
+
+    total = sum(b.get_total_time() for b in
+                Timeframe(Reader(path, mode='aggregate')._get_records(0)).sum())
+    assert total == args.ticks * runner.interval, (total, args.ticks)
+
+    print(f'{args.ticks} ticks in {t:.2f} s, {args.ticks / t:.0f} ticks/s')
+    print(f'writer: {runner.writer.metrics()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# Benchmark of `Reader._get_records`
+#
+# Compares the joined single query read path against the previous
+# implementation, which ran one query per container and one per block.
+#
+#   python3 -m bench.records --days 90
+#
+
+import argparse
+
+from bench import synthesize, temp_db, timeit
+from utils import Reader, Container, Block, Window
+
+
+def nested_records(reader, x, y):
+    '''Previous N+1 implementation of `Reader._get_records`, for reference'''
+    cur = reader.cur
+    cur.execute('select * from containers where name >= (?) and name <= (?);',
+                (x, y))
+
+    containers = []
+    for raw_container in cur.fetchall():
+        c = Container(raw_container[0], raw_container[1])
+        cur.execute('select b.block_id, b.container_id, a.name from blocks b '
+                    'join apps a on a.app_id = b.app_id '
+                    'where container_id = (?);', (c.id, ))
+        for raw_block in cur.fetchall():
+            b = Block(c.id, raw_block[0], raw_block[2])
+            cur.execute('select w.window_id, w.block_id, t.name, w.time '
+                        'from windows w join titles t on t.title_id = w.title_id '
+                        'where block_id = (?);', (b.block_id, ))
+            for raw_window in cur.fetchall():
+                b.add_window(Window(*raw_window[:4]))
+            c.add_block(b)
+        containers.append(c)
+
+    return containers
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reader read path benchmark')
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--interval', type=int, default=5)
+    args = parser.parse_args()
+
+    path = temp_db()
+    n = synthesize(path, days=args.days, interval=args.interval)
+    print(f'database: {path}, {n} containers')
+
+    r = Reader(path)
+    x = 0
+    y = int(r.now.timestamp())
+
+    old_t, old = timeit(lambda: nested_records(r, x, y))
+    new_t, new = timeit(lambda: r._get_records(x, y))
+
+    assert repr(old) == repr(new), 'read paths disagree'
+
+    print(f'nested queries:\t{old_t * 1000:.1f} ms')
+    print(f'joined query:\t{new_t * 1000:.1f} ms')
+    print(f'speedup:\t{old_t / new_t:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
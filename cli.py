@@ -2,6 +2,8 @@ import os
 import sys
 import argparse
 
+import live
+
 from utils import Reader, Timeframe
 
 
@@ -34,6 +36,11 @@ def set_parser():
         '--print_month',
         action='store_true',
         help='calculate and print month\'s usage')
+    parser.add_argument(
+        '-l',
+        '--live',
+        action='store_true',
+        help='print usage since the last write, from a running mlog --live')
     parser.add_argument(
         '-t',
         '--threshold',
@@ -54,9 +61,27 @@ def main():
 
     args = parser.parse_args()
 
-    r = Reader()
     t = 5 if args.threshold == None else args.threshold
 
+    if args.live:
+        try:
+            state = live.fetch()
+        except OSError:
+            print('mlog is not running with --live')
+            sys.exit(1)
+
+        active = state['active']
+        if active is not None:
+            print(f'Now: {active["name"]}, {active["window"]}')
+        print('Data range: since the last write')
+        # Not yet written data is about a minute, any threshold hides it
+        Timeframe([live.container(state)]).print(
+            threshold=0 if args.threshold is None else args.threshold)
+        return
+
+    # A run reads once, arrays of the columnar mode would not be reused
+    r = Reader(mode='aggregate')
+
     if args.print or args.print_today:
         print('Data range: today')
         Timeframe(r.today()).print(threshold=t)
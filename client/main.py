@@ -5,16 +5,28 @@
 #
 
 import json
+import gzip
+import time
 import datetime
 import operator
+import functools
+import threading
+import itertools
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
-from flask import Flask, request, render_template
-from utils import Reader, Timeframe
+import live
+
+from flask import Flask, Response, request, render_template, \
+    stream_with_context
+from utils import REPORT_MODE, Reader, Timeframe, day_bucket, next_day_bucket
 
 app = Flask(__name__)
-reader = Reader()
+reader = Reader(mode=REPORT_MODE, cache=True)
+# Serialized responses by (path, arguments), see payload()
+payloads = OrderedDict()
+payloads_lock = threading.Lock()
+PAYLOADS = 256
 readers = {
     'today': reader.today,
     'yesterday': reader.yesterday,
@@ -28,10 +40,70 @@ def home():
     return render_template('main.html')
 
 
+def payload(closed=False):
+    '''Serve JSON a view returns from a cache of serialized responses.
+
+    Responses are tagged by the day and the data version, so a request
+    with a matching If-None-Match gets 304 without any work, and a cached
+    response is served until the tag changes. Closed ranges, which end
+    before today, don't depend on the data version once the reader takes
+    today's first grace seconds as settled, and may be cached by browsers
+    until midnight.
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper():
+            now = time.time()
+            day = day_bucket(now)
+            if closed and now - day >= reader.grace:
+                tag = f'{day}'
+            else:
+                tag = f'{day}-{reader.data_version()}'
+
+            if request.if_none_match.contains(tag):
+                res = Response(status=304)
+            else:
+                res = Response(mimetype='application/json')
+                key = (request.path, tuple(sorted(request.args.items())))
+                with payloads_lock:
+                    entry = payloads.get(key)
+
+                if entry is None or entry[0] != tag:
+                    body = view().encode()
+                    entry = (tag, body, gzip.compress(body))
+
+                with payloads_lock:
+                    payloads[key] = entry
+                    payloads.move_to_end(key)
+                    if len(payloads) > PAYLOADS:
+                        payloads.popitem(last=False)
+
+                if 'gzip' in request.accept_encodings:
+                    res.set_data(entry[2])
+                    res.headers['Content-Encoding'] = 'gzip'
+                else:
+                    res.set_data(entry[1])
+
+            res.set_etag(tag)
+            res.vary.add('Accept-Encoding')
+            if tag == f'{day}':
+                age = int(next_day_bucket(now) - now)
+                res.headers['Cache-Control'] = f'private, max-age={age}'
+            else:
+                res.headers['Cache-Control'] = 'no-cache'
+
+            return res
+
+        return wrapper
+
+    return decorator
+
+
 #
 # API
 #
 @app.route('/records')
+@payload(closed=True)
 def records():
     '''Return JSON of records in a given time period'''
     days = request.args.get('days')
@@ -48,6 +120,7 @@ def records():
 
 
 @app.route('/records/today')
+@payload()
 def today_records():
     name = request.args.get('name')
     rec = reader.today()
@@ -61,6 +134,7 @@ def today_records():
 
 
 @app.route('/records/yesterday')
+@payload(closed=True)
 def yesterday_records():
     name = request.args.get('name')
     rec = reader.yesterday()
@@ -74,6 +148,7 @@ def yesterday_records():
 
 
 @app.route('/records/week')
+@payload()
 def week_records():
     name = request.args.get('name')
     rec = reader.last_weeks(1)
@@ -90,6 +165,7 @@ def week_records():
 # Inherited bug. Month is more that 4 weeks, appropriate method should be
 # added to the core of mlog.
 @app.route('/records/month')
+@payload()
 def month_records():
     name = request.args.get('name')
     rec = reader.last_weeks(4)
@@ -102,6 +178,234 @@ def month_records():
     return json.dumps(data)
 
 
+@app.route('/records/range')
+def range_records():
+    '''Return summed windows of an arbitrary range.
+
+    Arguments:
+        from, to:   epoch or ISO 8601 time, today's start and now by default
+        limit:      windows per page, 100 by default, 1000 at most
+        cursor:     next of the previous page, the key of its last window.
+                    Windows which appear in a range still being written,
+                    such as today, don't move the ones already paged
+                    through, but are only seen if they sort after the
+                    cursor.
+        stream:     if set, every window of the range as JSON lines,
+                    limit and cursor are ignored
+    '''
+    try:
+        x = parse_time(request.args.get('from'), day_bucket(time.time()))
+        y = parse_time(request.args.get('to'), int(time.time()))
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        after = parse_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return json.dumps({'status': 400, 'error': str(e)}), 400
+
+    if x > y or limit < 1:
+        return json.dumps({'status': 400, 'error': 'invalid range'}), 400
+
+    if request.args.get('stream'):
+        lines = (json.dumps(dict(name=name, window=str(window), time=t)) + '\n'
+                 for name, window, t in reader.rows(x, y))
+        return Response(stream_with_context(lines),
+                        mimetype='application/x-ndjson')
+
+    # One more row tells whether there is a next page
+    rows = reader.rows(x, y, after, keys=True)
+    page = list(itertools.islice(rows, limit + 1))
+    rows.close()
+    frames = [dict(name=name, window=str(window), time=t)
+              for _, name, window, t in page[:limit]]
+    more = len(page) > limit
+
+    return json.dumps({
+        'status': 200, 'from': x, 'to': y, 'frames': frames,
+        'next': '.'.join(map(str, page[limit - 1][0])) if more else None})
+
+
+def parse_cursor(value):
+    '''Row key of a cursor, None if there is no cursor'''
+    if not value:
+        return None
+
+    key = value.split('.')
+    if len(key) != 4 or not all(k.isdigit() for k in key):
+        raise ValueError(f'invalid cursor: {value}')
+
+    return tuple(map(int, key))
+
+
+def parse_time(value, default):
+    '''Epoch of an epoch or ISO 8601 string, default if it is None'''
+    if value is None:
+        return default
+
+    if value.isdigit():
+        return int(value)
+
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        raise ValueError(f'invalid time: {value}')
+
+
+class Broadcaster:
+    '''Push changes of today's totals to every open /records/stream.
+
+    One thread watches the data version mlog bumps on every write. When it
+    changes, today is summed once, incrementally by the reader, and the
+    difference to the previous totals is published as a delta, whatever
+    the number of subscribers. Subscribers wait on a condition for deltas
+    newer than the last one they have sent.
+    '''
+
+    def __init__(self, reader, interval=1, history=64):
+        self.reader = reader
+        self.interval = interval
+        self.history = history
+        self.totals = {}
+        self.day = None
+        self.version = None
+        self.seq = 0
+        self.deltas = []
+        self.changed = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        with self.changed:
+            if self.thread is None:
+                self.refresh()
+                self.thread = threading.Thread(
+                    target=self._loop, name='mlog-broadcast', daemon=True)
+                self.thread.start()
+
+    def snapshot(self):
+        '''Current totals as frames and the sequence number they are at'''
+        with self.changed:
+            return self.seq, frames(self.totals)
+
+    def wait(self, seq, timeout):
+        '''Deltas after seq, waits up to timeout seconds for one. None if
+        seq is too old to catch up with deltas, a snapshot is due.'''
+        with self.changed:
+            self.changed.wait_for(lambda: self.seq > seq, timeout)
+            missed = [d for d in self.deltas if d[0] > seq]
+            if self.seq > seq and (not missed or missed[0][0] != seq + 1):
+                return None
+            return missed
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                version = self.reader.data_version()
+                if (version != self.version
+                        or self.day != day_bucket(time.time())):
+                    with self.changed:
+                        self.refresh()
+            except Exception:
+                # Streams wait on this thread, it has to outlive any error
+                app.logger.exception('Failed to refresh today\'s totals')
+
+    def refresh(self):
+        '''Sum today and publish its difference to the last totals'''
+        day = day_bucket(time.time())
+        # Taken before reading, a write during the read is refreshed again
+        version = self.reader.data_version()
+        totals = {}
+        for block in Timeframe(self.reader.today()).sum():
+            for window in block.windows:
+                key = (block.name, str(window.name))
+                totals[key] = totals.get(key, 0) + window.time
+
+        if day != self.day:
+            # A new day starts from nothing, subscribers take a snapshot
+            self.deltas = []
+            delta = None
+        else:
+            delta = {k: t - self.totals.get(k, 0) for k, t in totals.items()
+                     if t != self.totals.get(k, 0)}
+            delta.update((k, -t) for k, t in self.totals.items()
+                         if k not in totals)
+            if not delta:
+                self.version = version
+                return
+
+        self.day = day
+        self.version = version
+        self.totals = totals
+        self.seq += 1
+        if delta is not None:
+            self.deltas.append((self.seq, frames(delta)))
+            del self.deltas[:-self.history]
+        self.changed.notify_all()
+
+
+def frames(totals):
+    '''(app, window): time as a list of dicts'''
+    return [dict(name=name, window=window, time=t)
+            for (name, window), t in totals.items()]
+
+
+broadcaster = Broadcaster(reader)
+
+
+@app.route('/records/stream')
+def stream_records():
+    '''Server-Sent Events of today's windows.
+
+    A snapshot event carries every window with its time, delta events carry
+    only windows whose time changed, with the change. A client which falls
+    behind gets a new snapshot.
+    '''
+    broadcaster.start()
+
+    def events():
+        seq, data = broadcaster.snapshot()
+        yield event('snapshot', seq, data)
+
+        while True:
+            deltas = broadcaster.wait(seq, 15)
+            if deltas is None:
+                seq, data = broadcaster.snapshot()
+                yield event('snapshot', seq, data)
+            elif not deltas:
+                # Keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+            for seq, data in deltas or []:
+                yield event('delta', seq, data)
+
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+
+def event(name, seq, data):
+    return f'event: {name}\nid: {seq}\ndata: {json.dumps(data)}\n\n'
+
+
+@app.route('/records/live')
+def live_records():
+    '''Usage not written yet, proxied from a running mlog --live'''
+    name = request.args.get('name')
+
+    try:
+        state = live.fetch()
+    except OSError:
+        return json.dumps({'status': 503, 'range': 0, 'frames': []})
+
+    rec = [live.container(state)]
+
+    if name == None:
+        data = get_bar_records(rec, 0)
+    else:
+        data = get_detailed_bar_records(rec, 0, name)
+
+    data['active'] = state['active']
+    return json.dumps(data)
+
+
 def get_bar_records(rec, range):
     data = Timeframe(rec).sum()
 
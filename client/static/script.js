@@ -161,7 +161,64 @@ function assignButtonCallbacks(buttons) {
  */
 function buttonCallback(range) {
     showLoadingMessage()
-    requestPrimaryData(range)
+    stopLive()
+
+    if (range == 'today')
+        startLive()
+    else
+        requestPrimaryData(range)
+}
+
+/**
+ * Today is kept up to date by records/stream. The server sends a snapshot
+ * of every window and then deltas after each write of mlog, which are
+ * applied here, so nothing is re-requested.
+ */
+let liveSource = undefined
+let liveWindows = new Map()
+
+function startLive() {
+    liveSource = new EventSource('records/stream')
+
+    liveSource.addEventListener('snapshot', (event) => {
+        liveWindows = new Map()
+        applyLive(JSON.parse(event.data))
+        removeLoadingMessage()
+    })
+
+    liveSource.addEventListener('delta', (event) => {
+        applyLive(JSON.parse(event.data))
+    })
+}
+
+function stopLive() {
+    if (liveSource != undefined)
+        liveSource.close()
+
+    liveSource = undefined
+}
+
+function applyLive(frames) {
+    frames.forEach((item) => {
+        const key = JSON.stringify([item.name, item.window])
+        const time = (liveWindows.get(key) || 0) + item.time
+
+        if (time > 0)
+            liveWindows.set(key, time)
+        else
+            liveWindows.delete(key)
+    })
+
+    const apps = new Map()
+    liveWindows.forEach((time, key) => {
+        const name = JSON.parse(key)[0]
+        apps.set(name, (apps.get(name) || 0) + time)
+    })
+
+    const bars = Array.from(apps, ([name, time]) => ({ name: name, time: time }))
+        .sort((x, y) => y.time - x.time)
+
+    createPrimaryChart({ frames: bars }, 'today')
 }
 
 function requestPrimaryData(range) {
@@ -170,7 +227,7 @@ function requestPrimaryData(range) {
     
     $.get(query, (data) => {
         // Wait until data is ready
-    }).done((data) => {
+    }, 'json').done((data) => {
         removeLoadingMessage()
         createPrimaryChart(data, range)
     })
@@ -182,7 +239,7 @@ function requestSecondaryData(range, label) {
 
     $.get(query, (data) => {
         // Wait until data is ready
-    }).done((data) => {
+    }, 'json').done((data) => {
         removeLoadingMessage()
         createSecondaryChart(data, range)
     })
@@ -202,8 +259,7 @@ function removeLoadingMessage() {
     })
 }
 
-function createPrimaryChart(data, range) {
-    const json = JSON.parse(data)
+function createPrimaryChart(json, range) {
     const frames = json.frames
     const threshold = 5
 
@@ -227,8 +283,7 @@ function createPrimaryChart(data, range) {
     })
 }
 
-function createSecondaryChart(data, range) {
-    const json = JSON.parse(data)
+function createSecondaryChart(json, range) {
     const windows = json.frames[0].windows
     const threshold = 5
 
@@ -0,0 +1,112 @@
+# Live state
+#
+# Runner keeps the most recent samples and the container it hasn't dumped
+# yet in memory. LiveServer serves them as JSON on a local port, so the
+# CLI and the Flask client can see what is going on right now without
+# waiting for a dump or touching the database.
+#
+
+import json
+
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from urllib.request import urlopen
+
+from utils import Block, Container, Window
+
+PORT = 5050
+
+
+class Recent:
+    '''Fixed size ring buffer of the most recent samples.
+
+    Epochs are kept in an array and names in preallocated lists, once the
+    buffer is full the oldest sample is overwritten. Default size holds an
+    hour of samples taken every 5 seconds.
+    '''
+
+    def __init__(self, size=720):
+        self.size = size
+        self.epochs = array('d', bytes(8 * size))
+        self.names = [None] * size
+        self.windows = [None] * size
+        self.count = 0
+
+    def add(self, log):
+        i = self.count % self.size
+        self.epochs[i] = log.epoch
+        self.names[i] = log.name
+        self.windows[i] = log.window
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def items(self):
+        '''Samples as (epoch, name, window), oldest first'''
+        res = []
+        for n in range(self.count - len(self), self.count):
+            i = n % self.size
+            res.append((self.epochs[i], self.names[i], self.windows[i]))
+
+        return res
+
+
+class LiveServer:
+    '''Serve state() as JSON over HTTP on localhost.
+
+    Requests are answered on their own threads, state is expected to be
+    safe to call from any of them.
+    '''
+
+    def __init__(self, state, port=PORT):
+        self.state = state
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path not in ('/', '/live'):
+                    handler.send_error(404)
+                    return
+
+                body = json.dumps(self.state()).encode()
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'application/json')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever,
+                             name='mlog-live', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def fetch(port=PORT, timeout=1):
+    '''Live state of a running mlog, raises OSError if it can't be reached'''
+    with urlopen(f'http://127.0.0.1:{port}/live', timeout=timeout) as res:
+        return json.load(res)
+
+
+def container(state):
+    '''Not yet dumped part of a live state as a reader's Container'''
+    c = Container(None, state['name'])
+    for block in state['blocks']:
+        b = Block(None, None, block['name'])
+        for window in block['windows']:
+            b.add_window(Window(None, None, window['name'], window['time']))
+        c.add_block(b)
+
+    return c
@@ -1,230 +1,161 @@
 import sqlite3
-import pygsheets
 import time
 import os
+import sys
+import argparse
+import traceback
 
 from time import sleep
-from objc import NULL
-from threading import Timer
-from AppKit import NSWorkspace as ws
-from Foundation import NSAppleScript
-from Quartz import CGWindowListCopyWindowInfo, kCGWindowListOptionOnScreenOnly, kCGNullWindowID
-from urllib.parse import urlparse
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from threading import Event, Lock, Thread, current_thread
+from queue import Queue, Full, Empty
+from utils import day_bucket, hour_bucket
+from schema import migrate
+from probes import default_probe
+from live import PORT, LiveServer, Recent
 
 __version__ = '0.0.1'
 
 
-class Application():
-    '''Active application wrapper
-    
-    Documentation:
-        https://developer.apple.com/documentation/appkit/nsapplication
-    
-    '''
-
-    def __init__(self, bid, pid, name, path, shigh, slow, key, tab=None):
-        self.name = name
-        self.bid = bid
-        self.pid = pid
-        self.path = path
-        self.shigh = shigh
-        self.slow = slow
-        self.key = key
-        # Window can be an app window or a browser tab which is effectively
-        # the same thing in mlog context.
-        if name == 'Google Chrome' or name == 'Safari' or name == 'Firefox':
-            self.window = tab.get_tab().parse_tab().domain
-        else:
-            self.window = self.get_window_name(self.pid)
-
-    def __repr__(self):
-        return f'Application(bid: {self.bid}, pid: {self.pid}, name: {self.name}, path: {self.path}' \
-            f'shigh: {self.shigh}, slow: {self.slow}, window: {self.window}, key: {self.key})'
-
-    def get_active(tab=None):
-        '''Constructor function (not a method) of an Application
-        
-        Example
-
-        app = Application.get_active()
-        window = app.get_window_name()
-
-        Returns:
-            Current active application'''
-        a = ws.sharedWorkspace().activeApplication()
-        return Application(a['NSApplicationBundleIdentifier'],
-                           a['NSApplicationProcessIdentifier'],
-                           a['NSApplicationName'], a['NSApplicationPath'],
-                           a['NSApplicationProcessSerialNumberHigh'],
-                           a['NSApplicationProcessSerialNumberLow'],
-                           a['NSWorkspaceApplicationKey'], tab)
-
-    def get_window_name(self, pid):
-        '''Get a window name by PID.
-        
-        This method employs functionality of Quartz Window Server in order
-        to get a name of the window.
+class Scheduler:
+    '''Run a function every interval seconds on one long lived thread.
 
-        Documentation:
-            https://developer.apple.com/documentation/coregraphics/quartz_window_services
-        '''
-        # List of currently opened windows
-        l = CGWindowListCopyWindowInfo(kCGWindowListOptionOnScreenOnly,
-                                       kCGNullWindowID)
-
-        for window in l:
-            if window['kCGWindowOwnerPID'] == pid:
-                return window['kCGWindowName']
-
-        return ''
-
-
-class Browser():
-    '''Browser utilities.
+    Ticks are planned against a monotonic clock as start + n * interval,
+    so neither a slow tick nor a wall clock change shifts the ones after
+    it. The function runs on a worker thread and a tick waits for it at
+    most timeout seconds, so a hung probe can't stall the loop. Interval
+    can be changed at any time, the next tick is planned from the last one.
 
-    Main task of Browser class is to find a name of currently opened tab
-    and parse it.
-
-    Current tab name exctracted using NSAppleScript, which is a part of Foundation
-    framework. General form of a query string:
-        tell application X
-            get URL of active tab of first window
-        end tell
-
-    Documentation:
-        https://developer.apple.com/documentation/foundation/nsapplescript
+    A tick which can't run is skipped and recorded in skipped, with the
+    reason:
+        late:       the loop woke up after the tick, e.g. after a sleep
+        busy:       the previous tick is still running
+        timeout:    the function didn't finish within timeout
+        error:      the function raised an exception
     '''
 
-    def __init__(self):
-        script_source = self._load_script()
-        self.script = NSAppleScript.alloc().initWithSource_(script_source)
-
-    def _load_script(self, path='scripts/'):
-        '''Load separate AppleScript file'''
-        spath = os.path.dirname(os.path.realpath(__file__)) + '/' + path
-        with open(spath + 'browser.applescript', 'r') as f:
-            data = f.read()
-
-        return data
+    Skip = namedtuple('Skip', 'epoch reason')
 
-    def find_tab(self):
-        '''Get a tab name from a current browser.
-
-        Documentation:
-            https://developer.apple.com/documentation/foundation/nsapplescript/1410034-executeandreturnerror?language=objc
-        '''
-        res = self.script.executeAndReturnError_(NULL)
-
-        # res is a tuple of 2 objects: (NSAppleEventDescription, objc.NULL)
-        if res[0] is None:
-            return None
-
-        return res[0].stringValue()
-
-
-class Tab(Browser):
-    '''Representation of relevant data from a browser's tab'''
-
-    def __init__(self):
-        '''Initialization should be performed semi-manually.
-        
-        Example:
-            t = Tab().get_tab().parse_tab()
-        
-        Reason for this is that parent class has two expensive routines:
-        _load_script:
-            Loads script from a file - i/o
-        NSAppleScript.alloc().initWithSource_():
-            Allocates space for and compiles a script
-        
-        Therefore we want to make these two steps to be performed only once.
-        '''
-        super().__init__()
-        self.url = None
-        self.scheme = None
-        self.domain = None
-        self.path = None
-
-    def get_tab(self):
-        self.url = self.find_tab()
-        return self
-
-    def parse_tab(self):
-        parser = urlparse(self.url)
-        self.scheme = parser.scheme
-        self.domain = parser.netloc
-        self.path = parser.path
-        return self
+    def __init__(self, interval=5, fn=None, timeout=None, history=1000):
+        self.interval = interval
+        self.fn = fn
+        self.timeout = interval if timeout is None else timeout
+        self.ticks = 0
+        # Most recent skips, skip_count counts all of them
+        self.skipped = deque(maxlen=history)
+        self.skip_count = 0
+        self.thread = None
+        self.worker = ThreadPoolExecutor(max_workers=1,
+                                         thread_name_prefix='mlog-probe')
+        self._future = None
+        self._stop = Event()
 
-    def __repr__(self):
-        return f'Tab(url: {self.url}, scheme: {self.scheme}, domain: {self.domain}, path: {self.path})'
+    def start(self):
+        self.thread = Thread(target=self._loop, name='mlog-scheduler',
+                             daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=0):
+        '''Stop ticking, waiting up to timeout seconds for a running tick
+        and calls already submitted to the worker'''
+        self._stop.set()
+        if self.thread is not None and self.thread is not current_thread():
+            self.thread.join()
+        if timeout:
+            # The only worker runs calls in order, this one runs after them
+            try:
+                self.worker.submit(int).result(timeout)
+            except FutureTimeout:
+                pass
+        self.worker.shutdown(wait=False)
+
+    def join(self):
+        self.thread.join()
+
+    def _loop(self):
+        start = time.monotonic()
+        interval = self.interval
+        n = 1
+
+        while True:
+            # Interval was changed, plan from the last tick on
+            if self.interval != interval:
+                start += (n - 1) * interval
+                interval = self.interval
+                n = 1
+
+            deadline = start + n * interval
+            if self._stop.wait(max(0, deadline - time.monotonic())):
+                return
 
+            # Ticks missed while the loop wasn't running
+            late = int((time.monotonic() - deadline) // interval)
+            for i in range(late):
+                self._skip(deadline + i * interval, 'late')
+            n += late
 
-class TimerTask:
-    def __init__(self, interval=5, fn=None):
-        self.timer = None
-        self.interval = interval
-        self.fn = fn
-        self.is_running = False
-        self.start()
+            self._tick(deadline + late * interval)
+            n += 1
 
-    def run(self):
-        self.is_running = False
-        self.start()
-        self.fn()
+    def _tick(self, deadline):
+        if self._future is not None and not self._future.done():
+            self._skip(deadline, 'busy')
+            return
 
-    def start(self):
-        if not self.is_running:
-            self.timer = Timer(self.interval, self.run)
-            self.timer.start()
-            self.is_running = True
+        self._future = self.worker.submit(self.fn)
+        try:
+            self._future.result(timeout=self.timeout)
+            self.ticks += 1
+        except FutureTimeout:
+            self._skip(deadline, 'timeout')
+        except Exception:
+            traceback.print_exc()
+            self._skip(deadline, 'error')
 
-    def stop(self):
-        self.timer.cancel()
-        self.is_running = False
+    def _skip(self, deadline, reason):
+        epoch = time.time() - (time.monotonic() - deadline)
+        self.skipped.append(Scheduler.Skip(int(epoch), reason))
+        self.skip_count += 1
 
 
 class Model:
     '''Simple persistent storage'''
 
     def __init__(self, dbname='.mlog.db'):
-        path = os.path.expanduser('~/') + dbname
+        path = os.path.join(os.path.expanduser('~'), dbname)
         self.con, self.cur = self.init(path)
         self.create_schema()
+        self.load_names()
 
     def init(self, n):
         con = sqlite3.connect(n, check_same_thread=False)
         cur = con.cursor()
+        # Write ahead log lets readers work while mlog writes. With it the
+        # normal sync level is still safe from corruption, commits just
+        # don't wait for an fsync until a checkpoint.
+        cur.executescript('''
+        pragma journal_mode = wal;
+        pragma synchronous = normal;
+        pragma temp_store = memory;
+        pragma busy_timeout = 5000;
+        ''')
         return con, cur
 
     def create_schema(self):
-        containers = '''
-        CREATE TABLE IF NOT EXISTS containers (
-            container_id    integer primary key autoincrement,
-            name            integer
-        );
-        '''
-        blocks = '''
-        create table if not exists blocks (
-            block_id        integer primary key autoincrement,
-            container_id    integer,
-            name            text,
-            foreign key (container_id) references containers (container_id)
-        );
-        '''
-        windows = '''
-        create table if not exists windows (
-            window_id   integer primary key autoincrement,
-            block_id    integer,
-            name        text,
-            time        integer,
-            foreign key (block_id) references blocks (block_id)
-        );
+        '''Create or upgrade the schema, see schema.py'''
+        migrate(self.con)
+
+    def load_names(self):
+        '''Load name to id maps of apps and titles.
+
+        Model is the only writer, so once loaded the maps never need a
+        lookup query.
         '''
-        self.cur.execute(containers)
-        self.cur.execute(blocks)
-        self.cur.execute(windows)
-        self.con.commit()
+        self.app_ids = dict(self.cur.execute('select name, app_id from apps;'))
+        self.title_ids = dict(
+            self.cur.execute('select name, title_id from titles;'))
 
     def drop(self):
         windows = 'drop table windows;'
@@ -233,33 +164,277 @@ class Model:
         self.cur.execute(windows)
         self.cur.execute(blocks)
         self.cur.execute(containers)
+        self.cur.execute('drop table hourly;')
+        self.cur.execute('drop table daily;')
+        self.cur.execute('drop table apps;')
+        self.cur.execute('drop table spans;')
+        self.cur.execute('drop table titles;')
+        self.cur.execute('drop table meta;')
+        self.cur.execute('pragma user_version = 0;')
         self.con.commit()
 
-    def add_container(self):
+    def add_container(self, container=None):
+        '''Write a container, its blocks, windows and rollups.
+
+        Everything is written with a statement per table in one transaction,
+        so a dump costs a single commit regardless of the container's size.
+
+        Arguments:
+            container: container or its snapshot, self by default
+        '''
+        container = self if container is None else container
+        self.write(lambda: self._add_container(container))
+
+    def add_spans(self, spans):
+        '''Write new spans and update the end of already stored ones'''
+        self.write(lambda: self._add_spans(spans))
+
+    def write(self, fn):
+        '''Run fn in a transaction and bump the data version'''
+        try:
+            with self.con:
+                fn()
+                self.bump()
+        except Exception:
+            # Names interned by a rolled back transaction don't exist
+            self.load_names()
+            raise
+
+    def bump(self):
+        '''Count a write in the data version, see Reader'''
+        self.cur.execute(
+            "update meta set value = value + 1 where key = 'data_version';")
+
+    def _add_container(self, container):
         q = 'insert into containers (name) values (?)'
-        self.cur.execute(q, (self.name, ))
+        self.cur.execute(q, (container.name, ))
 
         fk = self.cur.lastrowid
 
-        for block in self.blocks:
-            self.add_block(block, fk)
+        # Ids are assigned here to link windows to their blocks without
+        # a round trip per row. Model is the only writer.
+        block_id = self._next_id('blocks', 'block_id')
+        window_id = self._next_id('windows', 'window_id')
+
+        blocks = []
+        windows = []
+        rows = []
+        for block in container.blocks.values():
+            app_id = self.app_id(block.name)
+            blocks.append((block_id, fk, app_id))
+            for window in block.windows.values():
+                title_id = self.title_id(window.name)
+                windows.append((window_id, block_id, title_id,
+                                window.time))
+                rows.append((app_id, title_id, window.time, block_id,
+                             window_id))
+                window_id += 1
+            block_id += 1
+
+        q = 'insert into blocks (block_id, container_id, app_id) values (?, ?, ?)'
+        self.cur.executemany(q, blocks)
+
+        q = 'insert into windows (window_id, block_id, title_id, time) values (?, ?, ?, ?)'
+        self.cur.executemany(q, windows)
+
+        # Rollups are written in the same transaction as the container
+        self.add_rollups(container.name, rows)
+
+    def _add_spans(self, spans):
+        # A stored span is found by its start, so nothing but the database
+        # has to know whether a span was written before.
+        for span in spans:
+            row = (span.end, span.start, self.app_id(span.name),
+                   self.title_id(span.window))
+
+            q = '''
+            update spans set end_epoch = ?
+            where start_epoch = ? and app_id = ? and title_id = ?
+            '''
+            self.cur.execute(q, row)
+
+            if self.cur.rowcount == 0:
+                q = '''
+                insert into spans (end_epoch, start_epoch, app_id, title_id)
+                values (?, ?, ?, ?)
+                '''
+                self.cur.execute(q, row)
+
+    def _next_id(self, table, column):
+        '''Next autoincrement id of a table'''
+        q = f'''
+        select max(coalesce((select seq from sqlite_sequence where name = ?), 0),
+                   coalesce((select max({column}) from {table}), 0)) + 1;
+        '''
+        return self.cur.execute(q, (table, )).fetchone()[0]
 
-    def add_block(self, block, fk):
-        q = 'insert into blocks (container_id, name) values (?, ?)'
-        self.cur.execute(q, (fk, block.name))
+    def app_id(self, name):
+        '''Id of an application name, interned on first use'''
+        if name not in self.app_ids:
+            self.cur.execute('insert into apps (name) values (?)', (name, ))
+            self.app_ids[name] = self.cur.lastrowid
 
-        fk = self.cur.lastrowid
+        return self.app_ids[name]
 
-        for window in block.windows:
-            self.add_window(window, fk)
+    def title_id(self, name):
+        '''Id of a window name, interned on first use'''
+        if name not in self.title_ids:
+            self.cur.execute('insert into titles (name) values (?)', (name, ))
+            self.title_ids[name] = self.cur.lastrowid
 
-    def add_window(self, window, fk):
-        q = 'insert into windows (block_id, name, time) values (?, ?, ?)'
-        self.cur.execute(q, (fk, window.name, window.time))
+        return self.title_ids[name]
 
+    def add_rollups(self, epoch, rows):
+        '''Add rows of a container to its hourly and daily rollups.
+
+        Arguments:
+            epoch: container's name
+            rows: (app id, title id, time, block id, window id)
+        '''
+        q = '''
+        insert into {} (bucket, app_id, title_id, time, first_block,
+                        first_window)
+        values (?, ?, ?, ?, ?, ?)
+        on conflict (bucket, app_id, title_id)
+        do update set time = time + excluded.time;
+        '''
+        for table, bucket in (('hourly', hour_bucket(epoch)),
+                              ('daily', day_bucket(epoch))):
+            self.cur.executemany(q.format(table),
+                                 [(bucket, ) + row for row in rows])
+
+    def backfill(self):
+        '''Rebuild hourly and daily rollups from all stored containers.
+
+        Databases created before rollups were introduced have them only
+        for new containers, backfill makes rollups complete for the whole
+        history.
+        '''
+        self.con.create_function('day_bucket', 1, day_bucket)
+
+        q = '''
+        insert into {} (bucket, app_id, title_id, time, first_block,
+                        first_window)
+        select {}, b.app_id, w.title_id, sum(w.time), min(b.block_id),
+               min(w.window_id)
+        from containers c
+        join blocks b on b.container_id = c.container_id
+        join windows w on w.block_id = b.block_id
+        group by 1, 2, 3;
+        '''
+        self.cur.execute('delete from hourly;')
+        self.cur.execute('delete from daily;')
+        self.cur.execute(q.format('hourly', 'c.name - c.name % 3600'))
+        self.cur.execute(q.format('daily', 'day_bucket(c.name)'))
+        self.cur.execute(
+            "update meta set value = 0 where key = 'rollups_since';")
+        self.bump()
         self.con.commit()
 
 
+class Writer:
+    '''Write dumps to a persistent storage on a dedicated thread.
+
+    Dumps are put on a bounded queue as a Model method, which writes
+    without committing, and its argument. The writer thread takes
+    everything that is queued and writes it in one transaction, so
+    sampling never waits for the disk. If the queue is full put waits up
+    to timeout seconds and then drops the dump, both are counted in
+    metrics.
+    '''
+
+    def __init__(self, dbname='.mlog.db', size=64, timeout=1):
+        self.model = Model(dbname)
+        self.queue = Queue(maxsize=size)
+        self.timeout = timeout
+        self.thread = None
+        # Backpressure metrics
+        self.written = 0
+        self.batches = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.write_time = 0
+        self.last_write_time = 0
+
+    def start(self):
+        self.thread = Thread(target=self._loop, name='mlog-writer',
+                             daemon=True)
+        self.thread.start()
+        return self
+
+    def put(self, fn, arg):
+        if self.queue.full():
+            self.blocked += 1
+
+        try:
+            self.queue.put((fn, arg), timeout=self.timeout)
+        except Full:
+            self.dropped += 1
+            return
+
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def close(self):
+        '''Write everything that is queued and stop the writer thread'''
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def metrics(self):
+        return dict(depth=self.queue.qsize(), size=self.queue.maxsize,
+                    max_depth=self.max_depth, written=self.written,
+                    batches=self.batches, blocked=self.blocked,
+                    dropped=self.dropped, failed=self.failed,
+                    write_time=self.write_time,
+                    last_write_time=self.last_write_time)
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+
+            if batch:
+                self._write(batch)
+
+            if stop:
+                return
+
+    def _write(self, batch):
+        t = time.perf_counter()
+
+        try:
+            self.model.write(lambda: self._apply(batch))
+        except Exception:
+            # Write one by one, so a bad dump doesn't take the rest with it
+            for item in batch:
+                try:
+                    self.model.write(lambda: self._apply([item]))
+                except Exception:
+                    traceback.print_exc()
+                    self.failed += 1
+
+        self.last_write_time = time.perf_counter() - t
+        self.write_time += self.last_write_time
+        self.written += len(batch)
+        self.batches += 1
+
+    def _apply(self, batch):
+        for fn, arg in batch:
+            fn(self.model, arg)
+
+
 class Sheet():
     '''Experimental class for storing rows into Google Shread Sheets.
     
@@ -268,6 +443,8 @@ class Sheet():
     '''
 
     def __init__(self):
+        import pygsheets
+
         auth = pygsheets.authorize(service_file='api.json')
         self.data = auth.open('mlog').sheet1
         self.index = self._row_count()
@@ -286,19 +463,30 @@ class Log:
     Log is a simple, atomic information about a currently running application.
     '''
 
-    def __init__(self, app):
+    __slots__ = ('name', 'window', 'epoch')
+
+    def __init__(self, app, epoch=None):
         self.name = app.name
         self.window = app.window
-        self.epoch = time.time()
-        self.time, self.date = self.timestamp()
+        self.epoch = time.time() if epoch is None else epoch
+
+    # Formatted only when printed, not on every sample
+    @property
+    def time(self):
+        return self.timestamp()[0]
+
+    @property
+    def date(self):
+        return self.timestamp()[1]
 
     def __repr__(self):
         return f'Log(date: "{self.date}", time: "{self.time}",' \
                f' name: "{self.name}", window: "{self.window}")'
 
     def timestamp(self):
-        t = time.strftime("%H:%M:%S")
-        d = time.strftime("%d/%m/%Y")
+        local = time.localtime(self.epoch)
+        t = time.strftime("%H:%M:%S", local)
+        d = time.strftime("%d/%m/%Y", local)
         return t, d
 
 
@@ -316,6 +504,8 @@ class Container(Model):
             
             Application may has {1, .., n} windows. '''
 
+            __slots__ = ('name', 'time')
+
             def __init__(self, name, time):
                 self.name = name
                 self.time = int(time)
@@ -323,46 +513,57 @@ class Container(Model):
             def __repr__(self):
                 return f'Window(name: {self.name}, time: {self.time})'
 
+        __slots__ = ('name', 'windows')
+
         def __init__(self, name):
             self.name = name
-            self.windows = []
+            # Windows by name, dict keeps them in insertion order
+            self.windows = {}
 
         def add_window(self, name, time):
-            for window in self.windows:
-                if window.name == name:
-                    window.time += int(time)
-                    return
+            window = self.windows.get(name)
+            if window is not None:
+                window.time += int(time)
+                return
 
-            self.windows.append(Container.Block.Window(name, time))
+            self.windows[name] = Container.Block.Window(name, time)
 
         def __repr__(self):
-            s = ''
-            for window in self.windows:
-                s += window.__repr__() + ', '
+            s = ''.join(f'{window!r}, ' for window in self.windows.values())
 
             return f'Block(name: {self.name}, windows: {s})'
 
-    def __init__(self, interval=5):
-        super().__init__()
+    # Detached copy of a container's data handed over for writing
+    Snapshot = namedtuple('Snapshot', 'name blocks')
+
+    def __init__(self, interval=5, dbname='.mlog.db', writer=None):
+        super().__init__(dbname)
         self.interval = interval
         self.name = self._get_name()
-        self.blocks = []
+        # Blocks by application name, dict keeps them in insertion order
+        self.blocks = {}
+        # Writer thread to hand dumps to, dumps are written inline without it
+        self.writer = writer
 
     def _get_name(self):
         return int(time.time())
 
-    def add(self, log):
+    def add(self, log, time=None):
         '''Get a log and put it into corresponding block. If block doesnt exist,
-        create it.'''
-        for block in self.blocks:
-            if block.name == log.name:
-                # block exists, add time to it
-                block.add_window(log.window, self.interval)
-                return
+        create it.
+
+        Log is credited with time seconds, an interval by default.'''
+        time = self.interval if time is None else round(time)
+
+        block = self.blocks.get(log.name)
+        if block is not None:
+            # block exists, add time to it
+            block.add_window(log.window, time)
+            return
 
         b = Container.Block(log.name)
-        b.add_window(log.window, self.interval)
-        self.blocks.append(b)
+        b.add_window(log.window, time)
+        self.blocks[log.name] = b
 
     def dump(self):
         '''Write Containers data into a persistent storage.
@@ -370,35 +571,212 @@ class Container(Model):
         After dumping, deallocate all old blocks, since they are already stored
         and start to write new blocks.
         '''
-        self.add_container()
+        if not self.blocks:
+            return
+
+        snapshot = Container.Snapshot(self.name, self.blocks)
         self.name = self._get_name()
-        del self.blocks[:]
+        self.blocks = {}
+
+        if self.writer is None:
+            self.add_container(snapshot)
+        else:
+            self.writer.put(Model._add_container, snapshot)
+
+    def live(self):
+        '''Name and blocks not dumped yet, as plain data'''
+        blocks = [
+            dict(name=block.name, windows=[
+                dict(name=window.name, time=window.time)
+                for window in block.windows.values()])
+            for block in self.blocks.values()]
+
+        return dict(name=self.name, blocks=blocks)
 
     def __repr__(self):
-        s = ''
-        for block in self.blocks:
-            s += block.__repr__()
+        s = ''.join(map(repr, self.blocks.values()))
         return f'Container(name: {self.name}, blocks: {s})'
 
 
+class Spans(Model):
+    '''Spans record focus as intervals of time.
+
+    This is an alternative to Container storage. Instead of a snapshot of
+    blocks and windows per dump, a span (start, end, app, window) is kept
+    while the same window stays active, and it is extended in place. A
+    window used for an hour costs one row, and time is kept to a second.
+
+    Spans has the interface of Container, so Runner can use either.
+    '''
+
+    class Span:
+        '''Span is a time interval of one window of one application.'''
+
+        __slots__ = ('name', 'window', 'start', 'end')
+
+        def __init__(self, name, window, start, end):
+            self.name = name
+            self.window = window
+            self.start = start
+            self.end = end
+
+        def __repr__(self):
+            return f'Span(name: {self.name}, window: {self.window}, ' \
+                   f'start: {self.start}, end: {self.end})'
+
+    def __init__(self, interval=5, dbname='.mlog.db', writer=None):
+        super().__init__(dbname)
+        self.interval = interval
+        # Closed spans which are not written yet
+        self.spans = []
+        self.current = None
+        self.writer = writer
+
+    def add(self, log, time=None):
+        '''Extend the current span with a log, or start a new one if the
+        window changed or the log doesn't follow the span.
+
+        Log lasts time seconds, an interval by default.'''
+        start = int(log.epoch)
+        end = start + (self.interval if time is None else round(time))
+        span = self.current
+
+        if span is not None and span.name == log.name and \
+                span.window == log.window and start <= span.end + self.interval:
+            span.end = max(span.end, end)
+            return
+
+        if span is not None:
+            # Window changed somewhere in between the samples
+            span.end = max(span.start, min(span.end, start))
+            self.spans.append(span)
+
+        self.current = Spans.Span(log.name, log.window, start, end)
+
+    def dump(self):
+        '''Write closed spans and the current one into a persistent storage.
+
+        Spans which are already stored, such as the current span written
+        by a previous dump, are updated in place.
+        '''
+        spans = self.spans + ([self.current] if self.current else [])
+        self.spans = []
+
+        if not spans:
+            return
+
+        if self.writer is None:
+            self.add_spans(spans)
+        else:
+            self.writer.put(Model._add_spans, spans)
+
+    def live(self):
+        '''Spans not dumped yet summed into blocks, as plain data. Name is
+        the start of the first one.'''
+        spans = self.spans + ([self.current] if self.current else [])
+        blocks = {}
+        for span in spans:
+            windows = blocks.setdefault(span.name, {})
+            windows[span.window] = windows.get(span.window, 0) + \
+                span.end - span.start
+
+        blocks = [
+            dict(name=name, windows=[
+                dict(name=window, time=time)
+                for window, time in windows.items()])
+            for name, windows in blocks.items()]
+
+        return dict(name=spans[0].start if spans else None, blocks=blocks)
+
+    def __repr__(self):
+        spans = self.spans + ([self.current] if self.current else [])
+        s = ''.join(f'{span!r}, ' for span in spans)
+        return f'Spans({s})'
+
+
 class Runner:
-    def __init__(self, verbose=False):
+    storages = {'containers': Container, 'spans': Spans}
+
+    def __init__(self, verbose=False, storage='containers',
+                 dbname='.mlog.db', probe=None, events=False, heartbeat=30,
+                 adaptive=False, idle=120, live=None):
         self.interval = 5
         self.iteration = 1
         self.verbose = verbose
-        # Load an applescript and compile it during Tab initialization
-        self.tab = Tab()
-        self.container = Container(self.interval)
+        self.probe = default_probe() if probe is None else probe
+        # Dumps are written by the writer thread, sampling never waits on disk
+        self.writer = Writer(dbname).start()
+        self.container = self.storages[storage](self.interval, dbname,
+                                                self.writer)
         self.task = None
+        self.stopped = Event()
+        # Set under lock once the last dump is taken, see stop()
+        self.closed = False
+        # Event driven collection, see focus()
+        self.events = events
+        self.heartbeat = heartbeat
+        # Adaptive interval, see adapt()
+        self.adaptive = adaptive
+        self.idle = idle
+        self.fastest = 2
+        self.slowest = 60
+        # Last sample and its monotonic time, credited by the next one
+        self.last = None
+        self.last_at = None
+        self.gap = None
+        self.dumped = None
+        self.lock = Lock()
+        # Recent samples and the container are served on port live
+        self.recent = Recent()
+        self.live = live
+        self.server = None
 
     def start(self):
+        if self.events:
+            # Focus changes arrive as events, polling only has to notice
+            # title and tab changes inside of an application. A probe may
+            # report the current focus as soon as it watches, so focus()
+            # needs the scheduler before that
+            self.task = Scheduler(self.heartbeat, self.sample)
+            self.gap = self.heartbeat
+            if not self.probe.watch(self.focus):
+                self.task.stop()
+                self.task = None
+
+        if self.task is None:
+            self.events = False
+            if self.adaptive:
+                self.task = Scheduler(self.interval, self.sample)
+                self.gap = self.slowest
+            else:
+                self.task = Scheduler(self.interval, self.tick)
+
         if self.verbose:
             print(f'Starting mlog with settings:')
-            print(f'\tinterval: \t{self.interval} sec')
+            print(f'\tinterval: \t{self.task.interval} sec')
+            print(f'\tevents: \t{self.events}')
+            print(f'\tadaptive: \t{self.adaptive}')
+            print(f'\tlive: \t\t{self.live}')
+
+        if self.live is not None:
+            self.server = LiveServer(self.state, self.live).start()
+
+        self.task.start()
+
+    def wait(self):
+        '''Block until stopped, running the probe's event loop if it has one'''
+        self.probe.serve(self.stopped)
+
+    def tick(self):
+        '''Take a sample, add it to the container and dump once a minute'''
+        app = self.probe.active()
+        log = Log(app, self.probe.clock())
 
-        def activate():
-            log = Log(Application.get_active(self.tab))
+        with self.lock:
+            if self.closed:
+                return
             self.container.add(log)
+            self.recent.add(log)
 
             if self.verbose:
                 print()
@@ -408,14 +786,175 @@ class Runner:
                 self.container.dump()
                 self.iteration = 0
 
+                if self.verbose:
+                    print(f'writer: {self.writer.metrics()}')
+                    print(f'probe: {self.probe.metrics()}')
+
             self.iteration += 1
 
-        self.task = TimerTask(self.interval, activate)
+    def state(self):
+        '''Live state: the last sample, recent samples and blocks which
+        aren't dumped yet'''
+        with self.lock:
+            recent = self.recent.items()
+            state = self.container.live()
+
+        active = None
+        if recent:
+            epoch, app, window = recent[-1]
+            active = dict(epoch=epoch, name=app, window=window)
+
+        state.update(
+            epoch=time.time(),
+            active=active,
+            recent=[dict(epoch=e, name=n, window=w) for e, n, w in recent])
+        return state
+
+    def focus(self):
+        '''Focus changed, sample right away on the scheduler's worker'''
+        self.task.worker.submit(self.sample)
+
+    def sample(self):
+        '''Take a sample and credit the time since the previous one to it.
+
+        Used for event driven and adaptive collection. Whatever was sampled
+        last stayed active until now, so time is credited as it elapsed on
+        the monotonic clock rather than in whole intervals.
+        '''
+        # The probe may hang, it is read outside of the lock stop() takes
+        log = Log(self.probe.active(), self.probe.clock())
+        now = self.probe.monotonic()
+        away = 0
+        if self.adaptive:
+            idle = self.probe.idle()
+            if idle is not None and idle >= self.idle:
+                away = idle
+
+        with self.lock:
+            if self.closed:
+                return
+
+            self._credit(now, away)
+            self.recent.add(log)
+            previous = self.last
+            # Nobody is there, the sample isn't credited at all
+            self.last = None if away else log
+            self.last_at = now
+
+            if self.adaptive and not self.events:
+                self.task.interval = self.adapt(previous, log, away)
+
+            if self.verbose:
+                print()
+                print(self.container)
+
+            if self.dumped is None:
+                self.dumped = log.epoch
+            elif log.epoch - self.dumped >= 60:
+                self.container.dump()
+                self.dumped = log.epoch
+
+                if self.verbose:
+                    print(f'writer: {self.writer.metrics()}')
+                    print(f'probe: {self.probe.metrics()}')
+
+    def adapt(self, previous, log, away):
+        '''Interval until the next sample.
+
+        Back off to the slowest interval while the user is away, halve it
+        down to the fastest one while the window keeps changing, and come
+        back to the default one while it doesn't.
+        '''
+        interval = self.task.interval
+        if away:
+            return self.slowest
+
+        if interval > self.interval:
+            return self.interval
+
+        if previous is not None and (previous.name, previous.window) != (
+                log.name, log.window):
+            return max(self.fastest, interval / 2)
+
+        return min(self.interval, interval + 1)
+
+    def _credit(self, now, away=0):
+        '''Credit the last sample with the time until now, less the
+        time the user has been away for'''
+        if self.last is None:
+            return
+
+        elapsed = max(0, now - self.last_at - away)
+        # Without a sample for that long mlog wasn't running, e.g. the
+        # machine was asleep
+        if elapsed > 2 * self.gap:
+            elapsed = self.gap
+
+        # Stored time is in whole seconds
+        if round(elapsed):
+            self.container.add(self.last, elapsed)
 
     def stop(self):
-        self.task.stop()
+        '''Stop sampling and flush everything collected so far.
+
+        A sample still running on the scheduler's worker gets the probe's
+        timeout to finish. One which takes longer finds the runner closed
+        and adds nothing, so nothing is put after the writer is closed.
+        '''
+        if self.task is not None:
+            self.task.stop(self.task.timeout)
+
+        if self.server is not None:
+            self.server.stop()
+
+        if self.events:
+            self.probe.unwatch()
+
+        with self.lock:
+            if self.gap is not None:
+                self._credit(self.probe.monotonic())
+                self.last = None
+
+            self.container.dump()
+            self.closed = True
 
+        self.writer.close()
+        self.stopped.set()
 
 if __name__ == '__main__':
-    r = Runner(verbose=True)
-    r.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Automatic time tracker')
+    parser.add_argument(
+        '--backfill',
+        action='store_true',
+        help='build hourly and daily rollups for an existing database')
+    parser.add_argument(
+        '--spans',
+        action='store_true',
+        help='store focus spans instead of per minute containers')
+    parser.add_argument(
+        '--events',
+        action='store_true',
+        help='track focus changes as they happen instead of polling')
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='sample less often while idle and more while windows change')
+    parser.add_argument(
+        '--live',
+        action='store_true',
+        help='serve what is going on right now on localhost, see live.py')
+    args = parser.parse_args()
+
+    if args.backfill:
+        Model().backfill()
+        sys.exit(0)
+
+    r = Runner(verbose=True, storage='spans' if args.spans else 'containers',
+               events=args.events, adaptive=args.adaptive,
+               live=PORT if args.live else None)
+    r.start()
+
+    try:
+        r.wait()
+    except KeyboardInterrupt:
+        r.stop()
\ No newline at end of file
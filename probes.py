@@ -0,0 +1,600 @@
+# Probes
+#
+# A probe tells which application and which of its windows are active.
+# `Runner` depends only on the `Probe` interface, implementations are:
+#
+#   MacProbe:   AppKit, Quartz and AppleScript, the original mlog backend
+#   LinuxProbe: X11 window properties and procfs
+#   FakeProbe:  scripted samples with a virtual clock, for tests and
+#               benchmarks
+#
+
+import os
+import sys
+import time
+import subprocess
+import tracemalloc
+import threading
+
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import lru_cache
+from urllib.parse import urlparse
+
+try:
+    from objc import NULL
+    from AppKit import NSWorkspace as ws
+    from AppKit import NSWorkspaceDidActivateApplicationNotification
+    from Foundation import NSAppleScript, NSDate, NSRunLoop
+    from Quartz import CGWindowListCopyWindowInfo, kCGWindowListOptionOnScreenOnly, kCGNullWindowID
+    from Quartz import kCGWindowListOptionIncludingWindow, kCGWindowListOptionOnScreenAboveWindow
+    from Quartz import CGEventSourceSecondsSinceLastEventType, CGSessionCopyCurrentDictionary
+    from Quartz import kCGEventSourceStateCombinedSessionState, kCGAnyInputEventType
+except ImportError:
+    # Not macOS, or pyobjc isn't installed, MacProbe is unavailable
+    ws = None
+
+
+# Active application as reported by probes other than MacProbe
+Active = namedtuple('Active', 'name window pid bid')
+
+
+class Application():
+    '''Active application wrapper
+    
+    Documentation:
+        https://developer.apple.com/documentation/appkit/nsapplication
+    
+    '''
+
+    def __init__(self, bid, pid, name, path, shigh, slow, key, browsers=None,
+                 windows=None):
+        self.name = name
+        self.bid = bid
+        self.pid = pid
+        self.path = path
+        self.shigh = shigh
+        self.slow = slow
+        self.key = key
+        # Window can be an app window or a browser tab which is effectively
+        # the same thing in mlog context.
+        if browsers is not None and bid in browsers:
+            self.window = browsers.domain(bid)
+        elif windows is not None:
+            self.window = windows.name(self.pid)
+        else:
+            self.window = self.get_window_name(self.pid)
+
+    def __repr__(self):
+        return f'Application(bid: {self.bid}, pid: {self.pid}, name: {self.name}, path: {self.path}' \
+            f'shigh: {self.shigh}, slow: {self.slow}, window: {self.window}, key: {self.key})'
+
+    def get_active(browsers=None, windows=None):
+        '''Constructor function (not a method) of an Application
+        
+        Example
+
+        app = Application.get_active()
+        window = app.get_window_name()
+
+        Returns:
+            Current active application'''
+        a = ws.sharedWorkspace().activeApplication()
+        return Application(a['NSApplicationBundleIdentifier'],
+                           a['NSApplicationProcessIdentifier'],
+                           a['NSApplicationName'], a['NSApplicationPath'],
+                           a['NSApplicationProcessSerialNumberHigh'],
+                           a['NSApplicationProcessSerialNumberLow'],
+                           a['NSWorkspaceApplicationKey'], browsers, windows)
+
+    def get_window_name(self, pid):
+        '''Get a window name by PID.
+        
+        This method employs functionality of Quartz Window Server in order
+        to get a name of the window.
+
+        Documentation:
+            https://developer.apple.com/documentation/coregraphics/quartz_window_services
+        '''
+        # List of currently opened windows
+        l = CGWindowListCopyWindowInfo(kCGWindowListOptionOnScreenOnly,
+                                       kCGNullWindowID)
+
+        for window in l:
+            if window['kCGWindowOwnerPID'] == pid:
+                return window['kCGWindowName']
+
+        return ''
+
+
+class WindowCache:
+    '''Cache of the frontmost window of the active application.
+
+    Listing every on-screen window is the expensive part of a sample, so
+    the list is read only when the active application changes. Otherwise
+    the cached (pid, window number) is checked and read on its own:
+    windows above it are listed, which are few, and if one of them belongs
+    to the same application the user switched windows and the cache is
+    refreshed.
+    '''
+
+    def __init__(self, timed=None):
+        self.pid = None
+        self.number = None
+        self.refreshes = 0
+        self.timed = timed or (lambda stage: _nothing())
+
+    def name(self, pid):
+        if pid == self.pid and self.number is not None:
+            with self.timed('window'):
+                window = self._cached(pid)
+            if window is not None:
+                return window.get('kCGWindowName', '')
+
+        with self.timed('window_list'):
+            return self._refresh(pid)
+
+    def _cached(self, pid):
+        above = CGWindowListCopyWindowInfo(
+            kCGWindowListOptionOnScreenAboveWindow, self.number)
+        for window in above:
+            if window['kCGWindowOwnerPID'] == pid:
+                return None
+
+        windows = CGWindowListCopyWindowInfo(
+            kCGWindowListOptionIncludingWindow, self.number)
+        if not windows or windows[0]['kCGWindowOwnerPID'] != pid:
+            return None
+
+        return windows[0]
+
+    def _refresh(self, pid):
+        self.refreshes += 1
+        self.pid = pid
+        self.number = None
+
+        l = CGWindowListCopyWindowInfo(kCGWindowListOptionOnScreenOnly,
+                                       kCGNullWindowID)
+        for window in l:
+            if window['kCGWindowOwnerPID'] == pid:
+                self.number = window['kCGWindowNumber']
+                return window.get('kCGWindowName', '')
+
+        return ''
+
+
+class Browser():
+    '''Browser utilities.
+
+    Main task of Browser class is to find a name of currently opened tab
+    and parse it.
+
+    Current tab name exctracted using NSAppleScript, which is a part of Foundation
+    framework. General form of a query string:
+        tell application X
+            get URL of active tab of first window
+        end tell
+
+    Documentation:
+        https://developer.apple.com/documentation/foundation/nsapplescript
+    '''
+
+    def __init__(self, name='browser.applescript', **params):
+        script_source = self._load_script(name=name)
+        if params:
+            script_source = script_source.format(**params)
+        self.script = NSAppleScript.alloc().initWithSource_(script_source)
+        self.script.compileAndReturnError_(None)
+
+    def _load_script(self, path='scripts/', name='browser.applescript'):
+        '''Load separate AppleScript file'''
+        spath = os.path.dirname(os.path.realpath(__file__)) + '/' + path
+        with open(spath + name, 'r') as f:
+            data = f.read()
+
+        return data
+
+    def find_tab(self):
+        '''Get a tab name from a current browser.
+
+        Documentation:
+            https://developer.apple.com/documentation/foundation/nsapplescript/1410034-executeandreturnerror?language=objc
+        '''
+        res = self.script.executeAndReturnError_(NULL)
+
+        # res is a tuple of 2 objects: (NSAppleEventDescription, objc.NULL)
+        if res[0] is None:
+            return None
+
+        return res[0].stringValue()
+
+
+class Tab(Browser):
+    '''Representation of relevant data from a browser's tab'''
+
+    def __init__(self, name='browser.applescript', **params):
+        '''Initialization should be performed semi-manually.
+        
+        Example:
+            t = Tab().get_tab().parse_tab()
+        
+        Reason for this is that parent class has two expensive routines:
+        _load_script:
+            Loads script from a file - i/o
+        NSAppleScript.alloc().initWithSource_():
+            Allocates space for and compiles a script
+        
+        Therefore we want to make these two steps to be performed only once.
+        '''
+        super().__init__(name, **params)
+        self.url = None
+        self.scheme = None
+        self.domain = None
+        self.path = None
+
+    def get_tab(self):
+        self.url = self.find_tab()
+        return self
+
+    def parse_tab(self):
+        parser = _parse_url(self.url or '')
+        self.scheme = parser.scheme
+        self.domain = parser.netloc
+        self.path = parser.path
+        return self
+
+    def __repr__(self):
+        return f'Tab(url: {self.url}, scheme: {self.scheme}, domain: {self.domain}, path: {self.path})'
+
+
+@lru_cache(maxsize=1024)
+def _parse_url(url):
+    # Tabs stay on the same few URLs, parsing is done once per URL
+    return urlparse(url)
+
+
+class Browsers:
+    '''Active tab domain of the supported browsers.
+
+    Dispatched on bundle id. Each browser has its own script, loaded and
+    compiled the first time the browser is active and reused afterwards.
+    Scripts give up after timeout seconds, a call which failed or timed
+    out results in an empty domain.
+
+    Firefox has no scripting support for tabs, its window title is used.
+    '''
+
+    scripts = {
+        'com.google.Chrome': 'chrome.applescript',
+        'com.apple.Safari': 'safari.applescript',
+    }
+
+    def __init__(self, timeout=1, timed=None):
+        self.timeout = timeout
+        self.timed = timed or (lambda stage: _nothing())
+        self.tabs = {}
+        self.calls = 0
+        self.failures = 0
+        self.latency = None
+
+    def __contains__(self, bid):
+        return bid in self.scripts
+
+    def domain(self, bid):
+        tab = self.tabs.get(bid)
+        if tab is None:
+            tab = Tab(self.scripts[bid], timeout=self.timeout)
+            self.tabs[bid] = tab
+
+        start = time.perf_counter()
+        with self.timed('browser'):
+            tab.get_tab()
+        self.latency = time.perf_counter() - start
+        self.calls += 1
+
+        if tab.url is None:
+            self.failures += 1
+            return ''
+
+        return tab.parse_tab().domain
+
+    def metrics(self):
+        cache = _parse_url.cache_info()
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'latency': self.latency,
+            'parse_hits': cache.hits,
+            'parse_misses': cache.misses,
+        }
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+class Probe:
+    '''Source of samples of the active application.
+
+    Runner depends only on this interface:
+        active():   currently active application, an object with name and
+                    window attributes
+        clock():    epoch time of the sample taken last
+        metrics():  dict of probe specific counters
+        monotonic(): monotonic time of the sample taken last
+        idle():     seconds since the last user input, infinite while the
+                    screen is locked, None if unknown
+
+    Probes which can tell when focus changes also implement:
+        watch(fn):  call fn on every focus change, True if supported
+        unwatch():  stop calling it
+        serve(stop): run the probe's event loop, if it needs one, on the
+                    calling thread until stop is set
+
+    Probes time their stages through timed(). If hook is set it is called
+    after each stage as hook(stage, wall, cpu, allocated), with seconds of
+    wall clock and CPU time, and bytes allocated if tracemalloc is tracing,
+    None otherwise.
+    '''
+
+    hook = None
+
+    def active(self):
+        raise NotImplementedError
+
+    def clock(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def metrics(self):
+        return {}
+
+    def idle(self):
+        return None
+
+    def watch(self, fn):
+        return False
+
+    def unwatch(self):
+        pass
+
+    def serve(self, stop):
+        stop.wait()
+
+    @contextmanager
+    def timed(self, stage):
+        if self.hook is None:
+            yield
+            return
+
+        tracing = tracemalloc.is_tracing()
+        memory = tracemalloc.get_traced_memory()[0] if tracing else None
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if tracing:
+                memory = tracemalloc.get_traced_memory()[0] - memory
+            self.hook(stage, wall, cpu, memory)
+
+
+class MacProbe(Probe):
+    '''Active application and window of macOS'''
+
+    def __init__(self):
+        if ws is None:
+            raise RuntimeError('MacProbe requires pyobjc on macOS')
+
+        self.browsers = Browsers(timed=self.timed)
+        self.windows = WindowCache(self.timed)
+
+    def active(self):
+        with self.timed('active'):
+            return Application.get_active(self.browsers, self.windows)
+
+    def metrics(self):
+        return {
+            'browser': self.browsers.metrics(),
+            'window_refreshes': self.windows.refreshes,
+        }
+
+    def idle(self):
+        with self.timed('idle'):
+            session = CGSessionCopyCurrentDictionary()
+            if session and session.get('CGSSessionScreenIsLocked'):
+                return float('inf')
+
+            return CGEventSourceSecondsSinceLastEventType(
+                kCGEventSourceStateCombinedSessionState, kCGAnyInputEventType)
+
+    def watch(self, fn):
+        '''Observe application activations of the shared workspace.
+
+        Notifications are delivered by the main run loop, see serve().
+
+        Documentation:
+            https://developer.apple.com/documentation/appkit/nsworkspace/1530589-didactivateapplicationnotificati
+        '''
+        center = ws.sharedWorkspace().notificationCenter()
+        self.observer = center.addObserverForName_object_queue_usingBlock_(
+            NSWorkspaceDidActivateApplicationNotification, None, None,
+            lambda notification: fn())
+        return True
+
+    def unwatch(self):
+        if getattr(self, 'observer', None) is not None:
+            ws.sharedWorkspace().notificationCenter().removeObserver_(
+                self.observer)
+            self.observer = None
+
+    def serve(self, stop):
+        loop = NSRunLoop.currentRunLoop()
+        while not stop.is_set():
+            loop.runUntilDate_(NSDate.dateWithTimeIntervalSinceNow_(1))
+
+
+class LinuxProbe(Probe):
+    '''Active application and window of an X11 session.
+
+    Active window is read from _NET_ACTIVE_WINDOW of the root window, its
+    title and owner from _NET_WM_NAME and _NET_WM_PID, and the application
+    name from /proc/<pid>/comm. Properties are read with xprop, which comes
+    with X11 desktops.
+
+    Documentation:
+        https://specifications.freedesktop.org/wm-spec/latest/
+    '''
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self.spy = None
+        self.idles = True
+
+    def idle(self):
+        '''Idle time from xprintidle, None if it isn't installed'''
+        if not self.idles:
+            return None
+
+        with self.timed('idle'):
+            try:
+                res = subprocess.run(['xprintidle'], capture_output=True,
+                                     text=True, timeout=self.timeout)
+                return int(res.stdout) / 1000
+            except OSError:
+                self.idles = False
+            except (subprocess.TimeoutExpired, ValueError):
+                pass
+
+        return None
+
+    def active(self):
+        with self.timed('active'):
+            return self._active()
+
+    def watch(self, fn):
+        '''Follow _NET_ACTIVE_WINDOW changes with xprop -spy'''
+        try:
+            self.spy = subprocess.Popen(
+                ['xprop', '-spy', '-root', '_NET_ACTIVE_WINDOW'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        except OSError:
+            return False
+
+        def read(spy):
+            for _ in spy.stdout:
+                fn()
+
+        threading.Thread(target=read, args=(self.spy, ), name='mlog-focus',
+                         daemon=True).start()
+        return True
+
+    def unwatch(self):
+        if self.spy is not None:
+            self.spy.terminate()
+            self.spy = None
+
+    def _active(self):
+        wid = self._xprop('-root', '_NET_ACTIVE_WINDOW').split()
+        # _NET_ACTIVE_WINDOW(WINDOW): window id # 0x3a00007
+        if not wid or not wid[-1].startswith('0x') or int(wid[-1], 16) == 0:
+            return Active('', '', None, None)
+
+        props = self._xprop('-id', wid[-1], '_NET_WM_PID', '_NET_WM_NAME')
+
+        pid = None
+        title = ''
+        for line in props.splitlines():
+            # Missing properties read as `_NET_WM_PID:  not found.`
+            key, sep, value = line.partition(' = ')
+            if not sep:
+                continue
+            if key.startswith('_NET_WM_PID'):
+                pid = int(value)
+            elif key.startswith('_NET_WM_NAME'):
+                title = self._unquote(value)
+
+        return Active(self._process_name(pid), title, pid, None)
+
+    def _xprop(self, *args):
+        try:
+            res = subprocess.run(['xprop', *args], capture_output=True,
+                                 text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            return ''
+
+        return res.stdout
+
+    def _process_name(self, pid):
+        if pid is None:
+            return ''
+
+        try:
+            with open(f'/proc/{pid}/comm', 'r') as f:
+                return f.read().strip()
+        except OSError:
+            return ''
+
+    def _unquote(self, value):
+        '''xprop prints strings in double quotes with C style escapes'''
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
+
+        return value.replace('\\"', '"').replace('\\\\', '\\')
+
+
+class FakeProbe(Probe):
+    '''Deterministic probe for tests and benchmarks.
+
+    Replays (name, window) pairs of a script in a loop, or (name, window,
+    idle) triples to fake seconds since the last input. Its clock is
+    virtual and advances by step seconds per sample, so the whole
+    sample, aggregate and dump pipeline can be driven as fast as it runs.
+
+    Example:
+        probe = FakeProbe([('Code', 'mlog.py'), ('Safari', 'python.org')])
+        runner = Runner(probe=probe)
+        for _ in range(10000):
+            runner.tick()
+    '''
+
+    def __init__(self, script, step=5, start=None):
+        self.script = list(script)
+        self.step = step
+        self.index = 0
+        self.now = time.time() if start is None else start
+        self.idle_for = 0
+
+    def active(self):
+        name, window, *idle = self.script[self.index % len(self.script)]
+        self.idle_for = idle[0] if idle else 0
+        self.index += 1
+        self.now += self.step
+        return Active(name, window, None, None)
+
+    def clock(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def idle(self):
+        return self.idle_for
+
+
+def default_probe():
+    '''Probe of the platform mlog runs on'''
+    if sys.platform == 'darwin':
+        return MacProbe()
+
+    if sys.platform.startswith('linux'):
+        return LinuxProbe()
+
+    raise RuntimeError(f'mlog has no probe for {sys.platform}')
@@ -0,0 +1,282 @@
+# Database schema
+#
+# Schema of `~/.mlog.db` is versioned with `PRAGMA user_version`. Each
+# migration below brings a database one version up, `migrate` applies the
+# ones a database doesn't have yet. Both the collector and the readers
+# call it on start, so an existing database is upgraded in place by
+# whichever opens it first.
+#
+# Migrations are append only: never edit a released one, add a new one.
+#
+
+import sqlite3
+
+# Upserts and window functions need SQLite 3.25
+SQLITE = (3, 25, 0)
+
+
+def v1_tables(cur):
+    '''Base tables, rollups and meta.
+
+    Tables may already exist in databases created before versioning.
+    '''
+    containers = '''
+    CREATE TABLE IF NOT EXISTS containers (
+        container_id    integer primary key autoincrement,
+        name            integer
+    );
+    '''
+    blocks = '''
+    create table if not exists blocks (
+        block_id        integer primary key autoincrement,
+        container_id    integer,
+        name            text,
+        foreign key (container_id) references containers (container_id)
+    );
+    '''
+    windows = '''
+    create table if not exists windows (
+        window_id   integer primary key autoincrement,
+        block_id    integer,
+        name        text,
+        time        integer,
+        foreign key (block_id) references blocks (block_id)
+    );
+    '''
+    # Rollups are per hour and per day sums of windows, maintained on
+    # every dump. first_block and first_window keep the smallest ids
+    # which went into a row, so readers can order by first appearance.
+    rollup = '''
+    create table if not exists {} (
+        bucket          integer,
+        block_name      text,
+        window_name     text,
+        time            integer,
+        first_block     integer,
+        first_window    integer,
+        primary key (bucket, block_name, window_name)
+    );
+    '''
+    meta = '''
+    create table if not exists meta (
+        key     text primary key,
+        value   integer
+    );
+    '''
+    # Rollups are complete only for containers written after they were
+    # introduced, unless they are backfilled.
+    since = '''
+    insert or ignore into meta (key, value)
+    values ('rollups_since',
+            coalesce((select max(name) + 1 from containers), 0));
+    '''
+    cur.execute(containers)
+    cur.execute(blocks)
+    cur.execute(windows)
+    cur.execute(rollup.format('hourly'))
+    cur.execute(rollup.format('daily'))
+    cur.execute(meta)
+    cur.execute(since)
+
+
+def v2_indexes(cur):
+    '''Indexes for range scans and joins of the read path'''
+    cur.execute('create index if not exists containers_name '
+                'on containers (name);')
+    cur.execute('create index if not exists blocks_container_id '
+                'on blocks (container_id);')
+    cur.execute('create index if not exists windows_block_id '
+                'on windows (block_id);')
+
+
+def v3_names(cur):
+    '''Intern application and window names into dictionary tables.
+
+    blocks.name and windows.name are replaced by ids of apps and titles,
+    and rollups are keyed by the ids too. Tables are rebuilt, space of the
+    old text columns is reclaimed by a VACUUM after the migration.
+    '''
+    apps = '''
+    create table apps (
+        app_id      integer primary key,
+        name        text unique
+    );
+    '''
+    titles = '''
+    create table titles (
+        title_id    integer primary key,
+        name        text unique
+    );
+    '''
+    blocks = '''
+    create table blocks_v3 (
+        block_id        integer primary key autoincrement,
+        container_id    integer,
+        app_id          integer,
+        foreign key (container_id) references containers (container_id),
+        foreign key (app_id) references apps (app_id)
+    );
+    '''
+    windows = '''
+    create table windows_v3 (
+        window_id   integer primary key autoincrement,
+        block_id    integer,
+        title_id    integer,
+        time        integer,
+        foreign key (block_id) references blocks (block_id),
+        foreign key (title_id) references titles (title_id)
+    );
+    '''
+    rollup = '''
+    create table {}_v3 (
+        bucket          integer,
+        app_id          integer,
+        title_id        integer,
+        time            integer,
+        first_block     integer,
+        first_window    integer,
+        primary key (bucket, app_id, title_id)
+    );
+    '''
+    cur.execute(apps)
+    cur.execute(titles)
+    # Names are numbered in order of their first appearance. Names may be
+    # null, hence `is` in joins.
+    cur.execute('''
+    insert into apps (name)
+    select name from blocks group by name order by min(block_id);
+    ''')
+    cur.execute('''
+    insert into titles (name)
+    select name from windows group by name order by min(window_id);
+    ''')
+
+    cur.execute(blocks)
+    cur.execute('''
+    insert into blocks_v3 (block_id, container_id, app_id)
+    select b.block_id, b.container_id, a.app_id
+    from blocks b join apps a on a.name is b.name;
+    ''')
+    cur.execute(windows)
+    cur.execute('''
+    insert into windows_v3 (window_id, block_id, title_id, time)
+    select w.window_id, w.block_id, t.title_id, w.time
+    from windows w join titles t on t.name is w.name;
+    ''')
+
+    for table in ('hourly', 'daily'):
+        cur.execute(rollup.format(table))
+        cur.execute(f'''
+        insert into {table}_v3 (bucket, app_id, title_id, time, first_block,
+                                first_window)
+        select r.bucket, a.app_id, t.title_id, r.time, r.first_block,
+               r.first_window
+        from {table} r
+        join apps a on a.name is r.block_name
+        join titles t on t.name is r.window_name;
+        ''')
+
+    for table in ('blocks', 'windows', 'hourly', 'daily'):
+        cur.execute(f'drop table {table};')
+        cur.execute(f'alter table {table}_v3 rename to {table};')
+
+    # Indexes went away with the old tables
+    v2_indexes(cur)
+
+
+v3_names.vacuum = True
+
+
+def v4_spans(cur):
+    '''Run length encoded focus spans.
+
+    A span is a time interval [start_epoch, end_epoch) during which one
+    window of one application stayed active. Range queries are overlap
+    scans, hence the index on the end of a span.
+    '''
+    spans = '''
+    create table spans (
+        span_id         integer primary key autoincrement,
+        start_epoch     integer,
+        end_epoch       integer,
+        app_id          integer,
+        title_id        integer,
+        foreign key (app_id) references apps (app_id),
+        foreign key (title_id) references titles (title_id)
+    );
+    '''
+    cur.execute(spans)
+    cur.execute('create index spans_end_epoch on spans (end_epoch);')
+
+
+def v5_span_starts(cur):
+    '''Index to find a stored span by its start when it is extended'''
+    cur.execute('create index spans_start_epoch on spans (start_epoch);')
+
+
+def v6_data_version(cur):
+    '''Counter of writes, readers use it to tell if their results are stale'''
+    cur.execute('''
+    insert or ignore into meta (key, value) values ('data_version', 0);
+    ''')
+
+
+MIGRATIONS = [v1_tables, v2_indexes, v3_names, v4_spans,
+              v5_span_starts, v6_data_version]
+
+VERSION = len(MIGRATIONS)
+
+
+def version(con):
+    '''Schema version of a database'''
+    return con.execute('pragma user_version;').fetchall()[0][0]
+
+
+def migrate(con):
+    '''Apply pending migrations to a database.
+
+    Each migration runs in its own transaction together with the version
+    bump. The write lock is taken before the version is read, so
+    concurrent callers never apply the same migration twice. Migrations
+    which free a lot of pages are followed by a VACUUM.
+
+    Returns:
+        schema version of the database
+    '''
+    if sqlite3.sqlite_version_info < SQLITE:
+        raise RuntimeError(f'mlog requires SQLite 3.25 or newer, found '
+                           f'{sqlite3.sqlite_version}')
+
+    if version(con) >= VERSION:
+        return version(con)
+
+    isolation = con.isolation_level
+    con.isolation_level = None
+    cur = con.cursor()
+    vacuum = False
+
+    try:
+        while True:
+            cur.execute('begin immediate;')
+            current = version(con)
+            if current >= VERSION:
+                cur.execute('commit;')
+                break
+
+            migration = MIGRATIONS[current]
+            try:
+                migration(cur)
+                cur.execute(f'pragma user_version = {current + 1};')
+                cur.execute('commit;')
+            except Exception:
+                cur.execute('rollback;')
+                raise
+
+            vacuum = vacuum or getattr(migration, 'vacuum', False)
+
+        if vacuum:
+            cur.execute('vacuum;')
+    finally:
+        con.isolation_level = isolation
+
+    return version(con)
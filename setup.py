@@ -15,7 +15,7 @@ AUTHOR = 'Pavel Bazin'
 
 # What packages are required for this module to be executed?
 REQUIRED = [
-    'sqlite3', 'pygsheets', 'pyobjc'
+    'sqlite3', 'pygsheets', 'pyobjc; sys_platform == "darwin"'
 ]
 
 # The rest you shouldn't have to touch too much :)
@@ -66,13 +66,16 @@ setup(
     author=AUTHOR,
     author_email=EMAIL,
     url=URL,
-    packages=find_packages(exclude=('tests',)),
+    packages=find_packages(exclude=('tests', 'bench')),
     # If your package is a single module, use this instead of 'packages':
     # py_modules=['mypackage'],
 
     # entry_points={
     #     'console_scripts': ['mycli=mymodule:cli'],
     # },
+    # ThreadingHTTPServer, subprocess.run(capture_output=) and
+    # datetime.fromisoformat, SQLite 3.25 is checked by schema.migrate
+    python_requires='>=3.7',
     install_requires=REQUIRED,
     include_package_data=True,
     license='MIT',
@@ -81,10 +84,11 @@ setup(
         # Full list: https://pypi.python.org/pypi?%3Aaction=list_classifiers
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: Implementation :: CPython',
     ],
     # $ setup.py publish support.
@@ -0,0 +1,23 @@
+import unittest
+
+from probes import LinuxProbe
+
+
+class LinuxProbeTest(unittest.TestCase):
+
+    def probe(self, props):
+        p = LinuxProbe.__new__(LinuxProbe)
+        root = '_NET_ACTIVE_WINDOW(WINDOW): window id # 0x3a00007\n'
+        p._xprop = lambda *args: root if args[0] == '-root' else props
+        return p
+
+    def test_window_without_pid(self):
+        p = self.probe('_NET_WM_PID:  not found.\n'
+                       '_NET_WM_NAME(UTF8_STRING) = "Terminal"\n')
+        active = p._active()
+        self.assertIsNone(active.pid)
+        self.assertEqual(active.window, 'Terminal')
+
+
+if __name__ == '__main__':
+    unittest.main()
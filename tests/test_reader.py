@@ -0,0 +1,92 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from collections import namedtuple
+from datetime import datetime
+
+from mlog import Container
+from utils import Reader, Timeframe, day_bucket, np
+
+Sample = namedtuple('Sample', 'name window')
+
+
+def totals(records):
+    return {b.name: b.get_total_time() for b in Timeframe(records).sum()}
+
+
+def write(path, *containers):
+    '''Write 5 second containers of (name, app) as mlog does'''
+    c = Container(5, path)
+    for name, app in containers:
+        c.name = name
+        c.add(Sample(app, 'window'))
+        c.add_container()
+        c.blocks.clear()
+    c.con.close()
+
+
+class CachedRangesTest(unittest.TestCase):
+    '''Cached ranges which share a start must not share totals'''
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='mlog-test-')
+        self.path = os.path.join(self.dir, 'mlog.db')
+
+        now = time.time()
+        self.midnight = day_bucket(now)
+        if now - self.midnight < 2:
+            time.sleep(2)
+        # Ranges include both ends, today's container starts past midnight
+        write(self.path, (self.midnight - 12 * 3600, 'yday'),
+              (self.midnight + 1, 'today'))
+
+        # Yesterday isn't closed yet, as in the first minutes after midnight
+        self.grace = int(now - self.midnight) + 3600
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reader(self, **kwargs):
+        return Reader(self.path, grace=self.grace, **kwargs)
+
+    def test_yesterday_then_week(self):
+        r = self.reader(cache=True)
+        self.assertEqual(totals(r.yesterday()), {'yday': 5})
+        self.assertEqual(totals(r.last_weeks(1)),
+                         totals(self.reader().last_weeks(1)))
+
+    def test_week_then_yesterday(self):
+        r = self.reader(cache=True)
+        self.assertEqual(totals(r.last_weeks(1)), {'yday': 5, 'today': 5})
+        self.assertEqual(totals(r.yesterday()), {'yday': 5})
+
+    def test_rows_past_now(self):
+        r = self.reader(cache=True)
+        # Reader's clock is behind the writer's
+        r.now = datetime.fromtimestamp(self.midnight - 60)
+        self.assertEqual(totals(r.last_weeks(1)), {'yday': 5})
+        r.now = None
+        self.assertEqual(totals(r.last_weeks(1)), {'yday': 5, 'today': 5})
+
+    @unittest.skipIf(np is None, 'columnar mode requires numpy')
+    def test_columnar_late_write(self):
+        r = self.reader(mode='columnar')
+        self.assertEqual(totals(r.last_weeks(1)), {'yday': 5, 'today': 5})
+        # Yesterday's last container is written after midnight
+        write(self.path, (self.midnight - 30, 'yday'))
+        self.assertEqual(totals(r.last_weeks(1)), {'yday': 10, 'today': 5})
+
+    @unittest.skipIf(np is None, 'columnar mode requires numpy')
+    def test_columnar_loads_days_of_range(self):
+        r = self.reader(mode='columnar')
+        r.today()
+        self.assertIsNone(r._days)
+        r.last_days(1)
+        self.assertEqual(r._days_from, day_bucket(self.midnight - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
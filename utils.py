@@ -1,10 +1,44 @@
 import os
+import time
 import sqlite3
 import operator
 import datetime
 import json
+import threading
+import weakref
 
+from collections import OrderedDict
 from datetime import datetime as dt
+from schema import migrate
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional, only the columnar reader mode needs it
+    np = None
+
+# Fastest reader mode available for reports of a long running reader,
+# see Reader. A single report is summed faster by SQLite in aggregate
+# mode, the columnar one pays for loading rows into arrays first.
+REPORT_MODE = 'aggregate' if np is None else 'columnar'
+
+
+def hour_bucket(epoch):
+    '''Start of the hour of an epoch, key of the hourly rollup'''
+    return epoch - epoch % 3600
+
+
+def day_bucket(epoch):
+    '''Local midnight of an epoch, key of the daily rollup'''
+    t = dt.fromtimestamp(epoch)
+    return int(dt(t.year, t.month, t.day).timestamp())
+
+
+def next_day_bucket(epoch):
+    '''Local midnight following an epoch'''
+    t = dt.fromtimestamp(epoch)
+    return int((dt(t.year, t.month, t.day) + datetime.timedelta(days=1))
+               .timestamp())
 
 
 class Timeframe:
@@ -44,49 +78,33 @@ class Timeframe:
 
     def _group(self, blocks):
         '''Group blocks by name'''
-        # blocks = sorted(blocks, key=operator.attrgetter('name'))
-
-        # Linearly go though names and record all the possibilities
-        names = []
+        # Dict keeps names in the order of their first appearance
+        names = {}
         for block in blocks:
-            if block.name in names:
-                continue
-            else:
-                names.append(block.name)
+            windows = names.get(block.name)
+            if windows is None:
+                windows = names[block.name] = []
+            windows += block.windows
 
-        # Linearly create groups
         groups = []
-        for name in names:
-            groups.append(Block(None, None, name))
-
-        # Go linearly through each block in blocks and place them into
-        # group accordingly. This ops will take extra n space
-        for block in blocks:
-            for group in groups:
-                if block.name == group.name:
-                    group.windows += block.windows
+        for name, windows in names.items():
+            group = Block(None, None, name)
+            group.windows = windows
+            groups.append(group)
 
         return groups
 
     def _sum(self, groups):
         '''Sum time for each group'''
         for group in groups:
-            names = []
+            names = {}
             for window in group.windows:
-                if window.name in names:
-                    continue
-                else:
-                    names.append(window.name)
-
-            windows = []
-            for name in names:
-                windows.append(Window(None, None, name, 0))
+                item = names.get(window.name)
+                if item is None:
+                    item = names[window.name] = Window(None, None, window.name, 0)
+                item.time += window.time
 
-            for window in group.windows:
-                for item in windows:
-                    if window.name == item.name:
-                        item.time += window.time
-            group.windows = windows
+            group.windows = list(names.values())
 
         return groups
 
@@ -133,15 +151,20 @@ class Timeframe:
                 block.windows, key=operator.attrgetter('time'))[::-1]
             for window in block.windows:
                 wtime = int(window.time / 60)
-                if wtime >= threshold:
-                    print(f'\t* {wtime}\tmin \t{window.name}')
-                else:
+                if wtime < threshold:
                     continue
+                elif window.time < 60:
+                    print(f'\t* {window.time}\tsec \t{window.name}')
+                else:
+                    print(f'\t* {wtime}\tmin \t{window.name}')
 
             print()
 
 
 class Container:
+    # Reports build many thousands of these, slots keep them small
+    __slots__ = ('id', 'name', 'blocks')
+
     def __init__(self, id, name):
         self.id = id
         self.name = name
@@ -159,14 +182,15 @@ class Container:
         return sum
 
     def __repr__(self):
-        b = ''
-        for block in self.blocks:
-            b += block.__repr__()
+        b = ''.join(map(repr, self.blocks))
 
         return f'Container(id: {self.id}, name: {self.name}, blocks: [{b}])\n'
 
 
 class Block:
+    __slots__ = ('container_id', 'block_id', 'name', 'total_time',
+                 '_windows', '_names')
+
     def __init__(self, container_id, block_id, name):
         self.container_id = container_id
         self.block_id = block_id
@@ -174,9 +198,32 @@ class Block:
         self.total_time = 0
         self.windows = []
 
+    @property
+    def windows(self):
+        return self._windows
+
+    @windows.setter
+    def windows(self, windows):
+        self._windows = windows
+        self._names = None
+
+    @property
+    def names(self):
+        '''Index of windows by name for constant time lookups, the first
+        window wins if a name repeats. Built on first use, most blocks are
+        never looked up.'''
+        if self._names is None:
+            self._names = {}
+            for window in self._windows:
+                self._names.setdefault(window.name, window)
+
+        return self._names
+
     def add_window(self, window):
         assert type(window) is Window
-        self.windows.append(window)
+        self._windows.append(window)
+        if self._names is not None:
+            self._names.setdefault(window.name, window)
 
     def is_window(self, window):
         for w in self.windows:
@@ -185,17 +232,13 @@ class Block:
         return False
 
     def is_window_name(self, name):
-        for w in self.windows:
-            if w.name == name:
-                return True
-        return False
+        return name in self.names
 
     def add_to_name(self, name, time):
-        for w in self.windows:
-            if w.name == name:
-                w.time += time
-                return
-        raise NameError('no such a name')
+        w = self.names.get(name)
+        if w is None:
+            raise NameError('no such a name')
+        w.time += time
 
     def get_total_time(self):
         t = 0
@@ -206,15 +249,15 @@ class Block:
         return t
 
     def __repr__(self):
-        w = ''
-        for window in self.windows:
-            w += window.__repr__()
+        w = ''.join(map(repr, self.windows))
 
         return f'Block(container_id: {self.container_id}, block_id: {self.block_id},' \
                f'name: {self.name}, total_time: {self.total_time}, windows: [\n{w}])\n'
 
 
 class Window:
+    __slots__ = ('window_id', 'block_id', 'name', 'time')
+
     def __init__(self, window_id, block_id, name, time):
         self.window_id = window_id
         self.block_id = block_id
@@ -230,17 +273,271 @@ class Window:
                f'name: {self.name}, time: {self.time})\n'
 
 
+class Running:
+    '''Running totals of a range which is open at its end, such as today.
+
+    Keeps time per application and window, in the order of their first
+    appearance, and the last container and span folded into them. A
+    refresh folds in only rows written since, so it costs as much as the
+    new data does, not the whole range.
+
+    Only the last stored span can still be extended by mlog, it is read
+    again on every refresh and its previous time is taken back.
+    '''
+
+    def __init__(self, x):
+        self.x = x
+        self.totals = {}
+        self.container_id = None
+        self.span_id = None
+        self.span = None
+        self.version = None
+        self.container = None
+        # Rows starting after y of the last refresh are yet to be folded
+        self.pending = False
+
+    def refresh(self, cur, y, version=None):
+        '''Fold in rows written since the last refresh with cursor cur,
+        up to y, spans are clipped to y. Nothing is read if version is the
+        one of the last refresh and no rows were left past its y.'''
+        if (version is not None and version == self.version
+                and not self.pending):
+            return self.container
+
+        if self.container_id is None:
+            self._start(cur)
+
+        # Rows past y are left for a later refresh, watermarks stop below
+        # the first of them
+        q = '''
+        select min(container_id) from containers
+        where container_id > (?) and name > (?);
+        '''
+        stop = cur.execute(q, (self.container_id, y)).fetchone()[0]
+        self.pending = stop is not None
+        if stop is None:
+            q = 'select max(container_id) from containers'
+            stop = (cur.execute(q).fetchone()[0] or 0) + 1
+
+        q = '''
+        select c.container_id, a.name, t.name, w.time
+        from containers c
+        join blocks b on b.container_id = c.container_id
+        join apps a on a.app_id = b.app_id
+        join windows w on w.block_id = b.block_id
+        join titles t on t.title_id = w.title_id
+        where c.container_id > (?) and c.container_id < (?)
+          and c.name >= (?) and c.name <= (?)
+        order by c.container_id, b.block_id, w.window_id;
+        '''
+        for cid, app, title, secs in cur.execute(
+                q, (self.container_id, stop, self.x, y)):
+            self._add(app, title, secs)
+
+        # Containers without windows, or before x, still move the watermark
+        self.container_id = stop - 1
+
+        if self.span is not None:
+            app, title, secs = self.span
+            self._add(app, title, -secs)
+            self.span = None
+
+        q = '''
+        select min(span_id) from spans
+        where span_id >= (?) and start_epoch > (?);
+        '''
+        stop = cur.execute(q, (self.span_id, y)).fetchone()[0]
+        self.pending = self.pending or stop is not None
+
+        q = '''
+        select s.span_id, a.name, t.name,
+               min(s.end_epoch, ?) - max(s.start_epoch, ?)
+        from spans s
+        join apps a on a.app_id = s.app_id
+        join titles t on t.title_id = s.title_id
+        where s.span_id >= (?) and s.span_id < coalesce(?, s.span_id + 1)
+          and s.end_epoch > (?) and s.start_epoch <= (?)
+        order by s.span_id;
+        '''
+        for sid, app, title, secs in cur.execute(
+                q, (y, self.x, self.span_id, stop, self.x, y)):
+            self._add(app, title, secs)
+            self.span_id = sid
+            self.span = (app, title, secs)
+
+        self.version = version
+        self.container = self._build()
+        return self.container
+
+    def _start(self, cur):
+        '''Watermarks just below the first rows of the range'''
+        q = 'select min(container_id) from containers where name >= (?)'
+        first = cur.execute(q, (self.x, )).fetchone()[0]
+        if first is None:
+            q = 'select max(container_id) from containers'
+            first = (cur.execute(q).fetchone()[0] or 0) + 1
+        self.container_id = first - 1
+
+        q = 'select min(span_id) from spans where end_epoch > (?)'
+        first = cur.execute(q, (self.x, )).fetchone()[0]
+        if first is None:
+            q = 'select max(span_id) from spans'
+            first = (cur.execute(q).fetchone()[0] or 0) + 1
+        self.span_id = first
+
+    def _add(self, app, title, secs):
+        windows = self.totals.get(app)
+        if windows is None:
+            windows = self.totals[app] = {}
+        windows[title] = windows.get(title, 0) + secs
+
+    def _build(self):
+        c = Container(None, self.x)
+        for app, windows in self.totals.items():
+            b = Block(None, None, app)
+            for title, secs in windows.items():
+                if secs > 0:
+                    b.add_window(Window(None, None, title, secs))
+            if b.windows:
+                c.add_block(b)
+
+        return c
+
+
+class Lease:
+    '''Connection and cursor a thread reads through, see Reader.con'''
+    __slots__ = ('con', 'cur', '__weakref__')
+
+    def __init__(self, con, cur):
+        self.con = con
+        self.cur = cur
+
+
 class Reader:
-    def __init__(self, dbname='.mlog.db'):
-        path = os.path.expanduser('~/') + dbname
-        self.con, self.cur = self.init(path)
-        self.now = dt.now()
+    '''Read records from a persistent storage.
+
+    Reader works in one of two modes:
+        raw:        every container with its blocks and windows is loaded,
+                    Timeframe does all the summing.
+        aggregate:  summing is done by SQLite, a range is returned as one
+                    container with a block per application and a window
+                    per distinct window name. Timeframe accepts it as is,
+                    while memory and time no longer grow with the number of
+                    stored containers. Whole days and hours of a range are
+                    read from the daily and hourly rollups, only the edges
+                    are summed from containers.
+        columnar:   same as aggregate, but rows are loaded into NumPy
+                    arrays and summed by vectorized group by, which scales
+                    better over months and years. Requires numpy.
+
+    All modes read containers and focus spans, which are clipped to a range.
+
+    With cache results are kept in memory. A range is split at the start of
+    the last open day: closed days don't change, they are read once and
+    kept for good. The open day up to now is kept as Running totals which
+    fold in new rows whenever the data version, which mlog bumps on every
+    write, has changed. A day is closed once grace seconds passed since its
+    end, which covers a container written late.
+
+    Reader can be shared by threads. Each thread reads through its own
+    read only connection, taken from a pool of up to pool idle ones and
+    returned to it when the thread ends, so servers which run a request
+    per thread don't open a connection per request. now is the time of
+    the call, so a long running reader doesn't get stuck in the day it
+    was created.
+    '''
+
+    modes = ('raw', 'aggregate', 'columnar')
+
+    def __init__(self, dbname='.mlog.db', mode='raw', cache=False, size=256,
+                 grace=300, pool=8):
+        if mode not in self.modes:
+            raise ValueError(f'unknown reader mode: {mode}')
+
+        if mode == 'columnar' and np is None:
+            raise RuntimeError('columnar reader mode requires numpy')
+
+        self.path = os.path.join(os.path.expanduser('~'), dbname)
+        # Schema is upgraded once, connections of threads are read only
+        con = sqlite3.connect(self.path)
+        try:
+            migrate(con)
+        finally:
+            con.close()
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # Idle connections, see con
+        self.idle = []
+        self.idle_lock = threading.Lock()
+        self.pool = pool
+        self.mode = mode
+        self._now = None
+        # Daily rollups of closed days, for the columnar mode
+        self._days = None
+        self._days_from = None
+        self._days_until = None
+        self._days_version = None
+        # Cached results by range, see _get_cached
+        self.cache = OrderedDict() if cache else None
+        self.running = None
+        self.size = size
+        self.grace = grace
 
     def init(self, n):
-        con = sqlite3.connect(n, check_same_thread=False)
+        '''Read only connection to a database at n, with the database
+        mapped into memory'''
+        # Pooled connections are passed on to other threads
+        con = sqlite3.connect(f'file:{n}?mode=ro', uri=True,
+                              check_same_thread=False)
         cur = con.cursor()
+        cur.executescript('''
+        pragma query_only = 1;
+        pragma mmap_size = 268435456;
+        ''')
         return con, cur
 
+    @property
+    def con(self):
+        '''Connection of the calling thread'''
+        lease = getattr(self.local, 'lease', None)
+        if lease is None:
+            lease = self.local.lease = self._acquire()
+        return lease.con
+
+    @property
+    def cur(self):
+        self.con
+        return self.local.lease.cur
+
+    def _acquire(self):
+        '''Lease an idle or a new connection, which goes back to the pool
+        once the thread's lease is collected along with the thread'''
+        with self.idle_lock:
+            pair = self.idle.pop() if self.idle else None
+        if pair is None:
+            pair = self.init(self.path)
+
+        lease = Lease(*pair)
+        weakref.finalize(lease, self._release, pair)
+        return lease
+
+    def _release(self, pair):
+        with self.idle_lock:
+            if len(self.idle) < self.pool:
+                self.idle.append(pair)
+                return
+        pair[0].close()
+
+    @property
+    def now(self):
+        '''Current time, unless it is set to a fixed one'''
+        return dt.now() if self._now is None else self._now
+
+    @now.setter
+    def now(self, now):
+        self._now = now
+
     def ttoe(self, t):
         '''Datetime to epoch'''
         return int(t.timestamp())
@@ -275,10 +572,8 @@ class Reader:
 
     def last_weeks(self, n):
         x = self._zero(self.now) - datetime.timedelta(weeks=n)
-        y = self.now
         x_epoch = int(x.timestamp())
-        y_epoch = int(y.timestamp())
-        return self._get_records(x_epoch, y_epoch)
+        return self._get_records(x_epoch)
 
     def _zero(self, t):
         '''Remove hours, minutes, seconds from a datetime'''
@@ -299,44 +594,430 @@ class Reader:
         if type(x) != int:
             x = int(x)
 
-        if y == None:
+        # Only ranges up to now keep growing, others have a fixed end
+        open = y is None
+        if open:
             y = int(self.now.timestamp())
 
-        q = 'select * from containers where name >= (?) and name <= (?);'
+        if self.cache is not None:
+            return self._get_cached(x, y, open)
+
+        return self._read(x, y)
+
+    def _get_cached(self, x, y, open=False):
+        '''Get records from x to y from the cache, reading what is missing
+        or stale. Closed days and the rest are separate entries, the rest
+        of a range open up to now is kept as running totals.'''
+        now = time.time()
+        closed = day_bucket(now - self.grace)
+        version = self.data_version()
+
+        res = []
+        if x < closed:
+            res += self._remember((x, min(y, closed - 1)), None)
+        if y >= closed:
+            lo = max(x, closed)
+            if open:
+                res += self._get_running(lo, y, version)
+            else:
+                res += self._remember((lo, y), version)
+
+        return res
+
+    def _get_running(self, x, y, version):
+        '''Records from x to now from running totals of x'''
+        with self.lock:
+            if self.running is None or self.running.x != x:
+                self.running = Running(x)
+
+            c = self.running.refresh(self.cur, y, version)
+
+        return [c] if c.blocks else []
+
+    def _remember(self, key, version):
+        '''Cached result of key, read if missing or of another version.
+        Threads missing the same key may both read it.'''
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] == version:
+                self.cache.move_to_end(key)
+                return entry[1]
+
+        res = self._read(*key)
+
+        with self.lock:
+            self.cache[key] = (version, res)
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+        return res
+
+    def data_version(self):
+        '''Number of writes mlog has made, changes whenever data does'''
+        q = "select value from meta where key = 'data_version';"
+        row = self.cur.execute(q).fetchone()
+        return None if row is None else row[0]
+
+    def _read(self, x, y):
+        '''Read records from x to y in the reader's mode'''
+        if self.mode == 'aggregate':
+            return self._get_summary(x, y)
+
+        if self.mode == 'columnar':
+            return self._get_columns(x, y)
+
+        # One pass over a joined result set instead of a query per container
+        # and per block. Containers without blocks and blocks without windows
+        # are kept by the left joins, ordering by ids keeps the original
+        # insertion order of every level.
+        q = '''
+        select c.container_id, c.name, b.block_id, b.app_id,
+               w.window_id, w.title_id, w.time
+        from containers c
+        left join blocks b on b.container_id = c.container_id
+        left join windows w on w.block_id = b.block_id
+        where c.name >= (?) and c.name <= (?)
+        order by c.container_id, b.block_id, w.window_id;
+        '''
+        # Names are looked up by id, so every block and window of a name
+        # shares one string instead of a copy per row
+        apps = dict(self.cur.execute('select app_id, name from apps;'))
+        titles = dict(self.cur.execute('select title_id, name from titles;'))
         self.cur.execute(q, (x, y))
 
         containers = []
+        c = None
+        b = None
+
+        for row in self.cur:
+            cid, cname, bid, app_id, wid, title_id, wtime = row
 
-        for raw_container in self.cur.fetchall():
-            # for each container from containers table
-            c = Container(raw_container[0], raw_container[1])
+            if c is None or c.id != cid:
+                c = Container(cid, cname)
+                containers.append(c)
+                b = None
 
-            q = 'select * from blocks where container_id = (?);'
-            self.cur.execute(q, (c.id, ))
+            if bid is None:
+                continue
 
-            blocks = []
-            for raw_block in self.cur.fetchall():
-                # for each block from blocks table
-                b = Block(c.id, raw_block[0], raw_block[2])
+            if b is None or b.block_id != bid:
+                b = Block(c.id, bid, apps[app_id])
+                c.add_block(b)
 
-                q = 'select * from windows where block_id = (?);'
-                self.cur.execute(q, (b.block_id, ))
+            if wid is not None:
+                b.add_window(Window(wid, b.block_id, titles[title_id], wtime))
 
-                windows = []
-                for raw_window in self.cur.fetchall():
-                    # for each window from windows table
-                    w = Window(raw_window[0], raw_window[1], raw_window[2],
-                               raw_window[3])
-                    windows.append(w)
+        # Spans, if any, are read as containers of a single window
+        containers += self._get_spans(x, y)
 
-                for window in windows:
-                    b.add_window(window)
+        return containers
 
-                blocks.append(b)
+    def _get_spans(self, x, y):
+        '''Get spans overlapping x to y as containers.
 
-            for block in blocks:
-                c.add_block(block)
+        Each span is clipped to the range and becomes a container named by
+        the start of the span, with one block and one window.
+        '''
+        q = '''
+        select s.span_id, s.start_epoch,
+               min(s.end_epoch, ?) - max(s.start_epoch, ?), a.name, t.name
+        from spans s
+        join apps a on a.app_id = s.app_id
+        join titles t on t.title_id = s.title_id
+        where s.end_epoch > (?) and s.start_epoch < (?)
+        order by s.start_epoch;
+        '''
+        self.cur.execute(q, (y, x, x, y))
 
+        containers = []
+        for sid, start, time, bname, wname in self.cur:
+            c = Container(None, start)
+            b = Block(None, None, bname)
+            b.add_window(Window(None, None, wname, time))
+            c.add_block(b)
             containers.append(c)
 
         return containers
+
+    def _get_summary(self, x, y):
+        '''Get records from x to y summed by SQLite.
+
+        Blocks keep the order of their first appearance in the range and so
+        do windows inside of a block, which is the order Timeframe produces
+        from raw containers.
+
+        Returns:
+            list with a single container, or an empty list if the range
+            has no records
+        '''
+        c = Container(None, x)
+        b = None
+
+        for bname, wname, wtime in self.rows(x, y):
+            if b is None or b.name != bname:
+                b = Block(None, None, bname)
+                c.add_block(b)
+
+            b.add_window(Window(None, None, wname, wtime))
+
+        return [c] if c.blocks else []
+
+    def rows(self, x, y, after=None, keys=False):
+        '''Generate (app, window, time) of x to y summed by SQLite, in the
+        order of _get_summary.
+
+        Rows are taken from the database as they are consumed, a range of
+        any size takes no more memory than a row.
+
+        Arguments:
+            after:  key of a row, only rows after it are generated
+            keys:   generate (key, app, window, time), a key is a tuple of
+                    ids rows are ordered by. New rows of a range sort after
+                    the ones of the same application, so a key keeps its
+                    place while the range grows.
+        '''
+        source, args, _ = self._sources(x, y)
+
+        where = ''
+        if after is not None:
+            where = 'where (s.fb, s.app_id, s.fw, s.title_id) > (?, ?, ?, ?)'
+            args = list(args) + list(after)
+
+        # Summing and grouping is done on ids, names are joined only to
+        # the summed rows.
+        q = f'''
+        select s.fb, s.app_id, s.fw, s.title_id, a.name, t.name, s.time
+        from (
+            select app_id, title_id, sum(time) as time,
+                   min(min(first_block)) over (partition by app_id) as fb,
+                   min(first_window) as fw
+            from ({source})
+            group by app_id, title_id
+        ) s
+        join apps a on a.app_id = s.app_id
+        join titles t on t.title_id = s.title_id
+        {where}
+        order by s.fb, s.app_id, s.fw, s.title_id;
+        '''
+        # Own cursor, the generator may be consumed along with other reads
+        cur = self.con.cursor()
+        try:
+            for row in cur.execute(q, args):
+                yield (row[:4], ) + row[4:] if keys else row[4:]
+        finally:
+            cur.close()
+
+    def _get_columns(self, x, y):
+        '''Get records from x to y summed by NumPy.
+
+        Reads the same rows as _get_summary does, unsummed, and returns the
+        same container. Daily rollups of past days of a range are kept as
+        arrays until the data version changes, a container written late or
+        a backfill may change them. Only today, hours and edges of a range
+        are read from the database.
+        '''
+        until = day_bucket(time.time())
+        source, args, cached = self._sources(x, y, until)
+        self.cur.execute(source, args)
+        rows = self.cur.fetchall()
+
+        parts = [np.array(rows, dtype=np.int64).reshape(-1, 5)]
+        if cached:
+            days = self._load_days(cached[0][0], cached[-1][1],
+                                   self.data_version())
+            for lo, hi in cached:
+                i, j = np.searchsorted(days[:, 0], (lo, hi))
+                parts.append(days[i:j, 1:])
+
+        columns = np.concatenate(parts)
+        if not len(columns):
+            return []
+
+        app, title, secs, fb, fw = columns.T
+
+        # Group by (app, title) packed into one key
+        width = int(title.max()) + 1
+        keys, inverse = np.unique(app * width + title, return_inverse=True)
+        times = np.bincount(inverse, weights=secs).astype(np.int64)
+        first = np.full(len(keys), np.iinfo(np.int64).max)
+        np.minimum.at(first, inverse, fw)
+
+        # Blocks are ordered by the first appearance of the application
+        apps, app_inverse = np.unique(app, return_inverse=True)
+        app_first = np.full(len(apps), np.iinfo(np.int64).max)
+        np.minimum.at(app_first, app_inverse, fb)
+        group_app = keys // width
+        group_first = app_first[np.searchsorted(apps, group_app)]
+        order = np.lexsort((first, group_app, group_first))
+
+        names = self._names('apps', 'app_id', apps.tolist())
+        titles = self._names('titles', 'title_id',
+                             np.unique(keys % width).tolist())
+
+        c = Container(None, x)
+        b = None
+        for i in order.tolist():
+            app_id = int(keys[i] // width)
+            if b is None or b.name != names[app_id]:
+                b = Block(None, None, names[app_id])
+                c.add_block(b)
+
+            b.add_window(
+                Window(None, None, titles[int(keys[i] % width)], int(times[i])))
+
+        return [c]
+
+    def _names(self, table, key, ids):
+        '''Names of ids in an apps or titles table, in chunks which stay
+        below SQLite's limit of variables'''
+        names = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            q = (f'select {key}, name from {table} where {key} in '
+                 f'({", ".join("?" * len(chunk))});')
+            names.update(self.cur.execute(q, chunk))
+
+        return names
+
+    def _load_days(self, lo, hi, version=None):
+        '''Extend cached daily rollup rows to cover day buckets from lo to
+        hi, they are loaded again if the data version has changed. Cached
+        days are contiguous, only the missing ones are read.
+
+        Returns:
+            array of (bucket, app_id, title_id, time, first_block,
+            first_window) rows ordered by bucket
+        '''
+        q = '''
+        select bucket, app_id, title_id, time, first_block, first_window
+        from daily where bucket >= (?) and bucket < (?)
+        order by bucket;
+        '''
+
+        def read(lo, hi):
+            rows = self.cur.execute(q, (lo, hi)).fetchall()
+            return np.array(rows, dtype=np.int64).reshape(-1, 6)
+
+        with self.lock:
+            if self._days is None or version != self._days_version:
+                self._days = read(lo, hi)
+                self._days_from = lo
+                self._days_until = hi
+                self._days_version = version
+                return self._days
+
+            parts = [self._days]
+            if lo < self._days_from:
+                parts.insert(0, read(lo, self._days_from))
+                self._days_from = lo
+            if hi > self._days_until:
+                parts.append(read(self._days_until, hi))
+                self._days_until = hi
+            if len(parts) > 1:
+                self._days = np.concatenate(parts)
+
+            return self._days
+
+    def _sources(self, x, y, until=None):
+        '''Query of unsummed (app_id, title_id, time, first_block,
+        first_window) rows of x to y, and its arguments.
+
+        Rows come from rollups, containers and spans, see _segments.
+        first_block and first_window order rows by their first appearance.
+
+        Days before until are left out of the query and returned as a list
+        of (lo, hi) ranges for the caller to read.
+        '''
+        rollup = '''
+        select app_id, title_id, time, first_block, first_window
+        from {} where bucket >= (?) and bucket < (?)
+        '''
+        raw = '''
+        select b.app_id, w.title_id, w.time,
+               b.block_id as first_block, w.window_id as first_window
+        from containers c
+        join blocks b on b.container_id = c.container_id
+        join windows w on w.block_id = b.block_id
+        where c.name >= (?) and c.name < (?)
+        '''
+        sources = {'day': rollup.format('daily'),
+                   'hour': rollup.format('hourly'),
+                   'raw': raw}
+
+        parts = []
+        args = []
+        cached = []
+        for kind, lo, hi in self._segments(x, y + 1):
+            if kind == 'day' and until is not None and lo < until:
+                cached.append((lo, min(hi, until)))
+                lo = min(hi, until)
+                if lo == hi:
+                    continue
+
+            parts.append(sources[kind])
+            args += [lo, hi]
+
+        # Spans are clipped to the range, their ids order them
+        parts.append('''
+        select app_id, title_id,
+               min(end_epoch, ?) - max(start_epoch, ?) as time,
+               span_id as first_block, span_id as first_window
+        from spans where end_epoch > (?) and start_epoch < (?)
+        ''')
+        args += [y, x, x, y]
+
+        return ' union all '.join(parts), args, cached
+
+    def _rollups_since(self):
+        '''Epoch from which rollups are complete, None if there are none'''
+        q = "select value from meta where key = 'rollups_since';"
+        try:
+            row = self.cur.execute(q).fetchone()
+        except sqlite3.OperationalError:
+            return None
+
+        return None if row is None else row[0]
+
+    def _segments(self, x, end):
+        '''Split a half open range [x, end) by the source to read it from.
+
+        Whole local days come from the daily rollup, whole hours from the
+        hourly one, and whatever is left, or isn't covered by rollups yet,
+        from containers.
+
+        Returns:
+            list of (kind, lo, hi), where kind is day, hour or raw
+        '''
+        segments = []
+        since = self._rollups_since()
+        if since is None:
+            since = end
+
+        def add(kind, lo, hi):
+            if segments and segments[-1][0] == kind:
+                segments[-1] = (kind, segments[-1][1], hi)
+            else:
+                segments.append((kind, lo, hi))
+
+        cur = x
+        if cur < since:
+            add('raw', cur, min(since, end))
+            cur = min(since, end)
+
+        while cur < end:
+            nday = next_day_bucket(cur)
+            nhour = hour_bucket(cur) + 3600
+
+            if day_bucket(cur) == cur and nday <= end:
+                add('day', cur, nday)
+                cur = nday
+            elif hour_bucket(cur) == cur and nhour <= min(nday, end):
+                add('hour', cur, nhour)
+                cur = nhour
+            else:
+                stop = min(nday, nhour, end)
+                add('raw', cur, stop)
+                cur = stop
+
+        return segments